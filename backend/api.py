@@ -1,70 +1,153 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
 import mysql.connector
 import os
+import json
+import uuid
+import queue
+import base64
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from pdf_parser import process_pdf
-import tempfile
-import pika
-import json
+from blob_store import get_blob_store
+from schema import ensure_schema
+from db import get_db_connection
+from publisher import get_publisher
+from norms_cache import get_norms_cache, get_norms_response_cache, bump_norms_version, warm_norms_cache
+from results_store import revalidate_grade
+from progress_events import get_progress_hub, progress_event, emit_progress_batch, STAGE_QUEUED
+from datetime import datetime, timedelta
 # Load environment variables
 
 
 load_dotenv()
 
+MAX_UPLOAD_FILE_SIZE = int(os.getenv("MAX_UPLOAD_FILE_SIZE", 50 * 1024 * 1024))
+MAX_UPLOAD_REQUEST_SIZE = int(os.getenv("MAX_UPLOAD_REQUEST_SIZE", 1024 * 1024 * 1024))
+VALIDATIONS_PAGE_SIZE = int(os.getenv("VALIDATIONS_PAGE_SIZE", 50))
+VALIDATIONS_MAX_PAGE_SIZE = int(os.getenv("VALIDATIONS_MAX_PAGE_SIZE", 200))
+CATEGORY_CACHE_MAX_AGE = int(os.getenv("CATEGORY_CACHE_MAX_AGE", 0))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", 15))
+PDF_MAGIC = b"%PDF-"
+PDF_MAGIC_WINDOW = 1024  # readers accept the header anywhere in the first KiB
+
+
+class UploadPart:
+    # Sink the multipart parser writes one uploaded file into. Bytes go once, in the parser's
+    # chunks, to a blob store staging file while being hashed and checked; nothing is buffered.
+    def __init__(self, filename):
+        self.filename = filename
+        self.error = None
+        self._head = b""
+        self._writer = None
+        if not (filename or "").lower().endswith(".pdf"):
+            self.error = "Only PDF files are allowed"
+        else:
+            self._writer = get_blob_store().open_writer()
+
+    def write(self, data):
+        if self.error:
+            return len(data)
+
+        if len(self._head) < PDF_MAGIC_WINDOW:
+            self._head += data[:PDF_MAGIC_WINDOW - len(self._head)]
+            if len(self._head) >= PDF_MAGIC_WINDOW and PDF_MAGIC not in self._head:
+                self._reject("File is not a PDF")
+                return len(data)
+
+        if self._writer.size + len(data) > MAX_UPLOAD_FILE_SIZE:
+            self._reject(f"File exceeds the {MAX_UPLOAD_FILE_SIZE / (1024 * 1024):g} MB limit")
+            return len(data)
+        return self._writer.write(data)
+
+    def seek(self, offset, whence=0):
+        # The parser rewinds each finished part; the staged bytes are never read back here.
+        return 0
+
+    def read(self, size=-1):
+        return b""
+
+    def _reject(self, error):
+        self.error = error
+        self._writer.abort()
+
+    def commit(self):
+        if not self.error and PDF_MAGIC not in self._head:
+            self._reject("File is not a PDF")
+        if self.error:
+            raise ValueError(self.error)
+        return self._writer.commit()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.abort()
+
+
+class StreamingUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadPart(filename)
+
+
 app = Flask(__name__)
+app.request_class = StreamingUploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_REQUEST_SIZE
 CORS(app)
-# Database connection
+# Database connection: one pooled connection per request, returned on teardown
 
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME"),
-        port=int(os.getenv("DB_PORT", 3306))
-    )
+def get_request_db():
+    if "db" not in g:
+        g.db = get_db_connection()
+    return g.db
 
 
-UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+@app.before_request
+def prepare_schema():
+    ensure_schema()
 
 
-def persist_certificate(filename, file_path, category):
+@app.teardown_appcontext
+def release_request_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.close()
+
+
+def persist_certificates(certificates):
+    # One multi-row INSERT in one transaction; the batch token maps the new ids back in order.
+    batch = uuid.uuid4().hex
     try:
-        conn = get_db_connection()
+        conn = get_request_db()
         cursor = conn.cursor()
-        query = """
-            INSERT INTO parsed_pdfs (filename, file_path, category)
-            VALUES (%s, %s, %s)
-        """
-        cursor.execute(query, (filename, file_path, category))
+        names = sorted({c["category"] for c in certificates})
+        cursor.execute(f"SELECT name, id FROM categories WHERE name IN ({', '.join(['%s'] * len(names))})", names)
+        category_ids = dict(cursor.fetchall())
+        cursor.executemany("""
+            INSERT INTO parsed_pdfs (filename, content_hash, category, category_id, upload_batch)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [(c["filename"], c["content_hash"], c["category"], category_ids.get(c["category"]), batch) for c in certificates])
+        cursor.execute("SELECT id FROM parsed_pdfs WHERE upload_batch = %s ORDER BY id", (batch,))
+        pdf_ids = [row[0] for row in cursor.fetchall()]
         conn.commit()
         cursor.close()
-        conn.close()
     except mysql.connector.Error as err:
         raise Exception(f"Database error: {err}")
 
+    for certificate, pdf_id in zip(certificates, pdf_ids):
+        certificate["pdf_id"] = pdf_id
+    return certificates
 
-def publish_to_queue(filename, file_path, category):
-    connection = pika.BlockingConnection(pika.ConnectionParameters(os.getenv("RABBITMQ_HOST", "localhost")))
-    channel = connection.channel()
-    channel.queue_declare(queue='pdf_processing')
 
-    message = {
-        'file_path': file_path,
-        'filename': filename,
-        'category': category
-    }
-    channel.basic_publish(
-        exchange='',
-        routing_key='pdf_processing',
-        body=json.dumps(message)
-    )
-    connection.close()
-    print(f"Published {filename} to queue.")
+def publish_to_queue(certificates):
+    # The consumer reads the PDF from the shared blob store by digest, so it can run on another host.
+    get_publisher().publish_batch([{
+        'pdf_id': c["pdf_id"],
+        'content_hash': c["content_hash"],
+        'filename': c["filename"],
+        'category': c["category"]
+    } for c in certificates])
+    print(f"Published {len(certificates)} certificate(s) to queue.")
+    emit_progress_batch([progress_event(c["pdf_id"], STAGE_QUEUED, filename=c["filename"], category=c["category"])
+                         for c in certificates])
 
 
 @app.route("/upload", methods=["POST"])
@@ -78,7 +161,7 @@ def upload_pdfs():
     if not files:
         return jsonify({"error": "No files uploaded"}), 400
 
-    successful_count = 0
+    accepted = []
     errors = []
 
     for file in files:
@@ -86,31 +169,32 @@ def upload_pdfs():
             errors.append({"filename": None, "error": "Empty filename"})
             continue
 
-        if not file.filename.lower().endswith(".pdf"):
+        if file.stream.error:
             errors.append({"filename": file.filename,
-                          "error": "Only PDF files are allowed"})
+                          "error": file.stream.error})
             continue
 
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-                temp_pdf.write(file.read())
-                temp_pdf_path = temp_pdf.name
-                original_filename = secure_filename(file.filename)
-                save_path = os.path.join(UPLOAD_DIR, original_filename)
-                file.save(save_path)
-
-            # Instead of processing the PDF here, we will publish it to a message queue
-            # For example, using RabbitMQ or any other message broker
-            # publish_to_queue(temp_pdf_path)  # Placeholder for actual message queue publishing
-            # process_pdf(temp_pdf_path, category)
-            persist_certificate(original_filename, temp_pdf_path, category)
-            publish_to_queue(original_filename, temp_pdf_path, category)
-            successful_count += 1
-
+            accepted.append({
+                "filename": secure_filename(file.filename),
+                "original_filename": file.filename,
+                "content_hash": file.stream.commit(),
+                "category": category
+            })
         except Exception as e:
             errors.append({"filename": file.filename,
                           "error": f"Processing failed: {str(e)}"})
 
+    successful_count = 0
+    if accepted:
+        try:
+            persist_certificates(accepted)
+            publish_to_queue(accepted)
+            successful_count = len(accepted)
+        except Exception as e:
+            errors.extend({"filename": c["original_filename"],
+                           "error": f"Processing failed: {str(e)}"} for c in accepted)
+
     response = {
         "message": f"{successful_count} Certificate{'s' if successful_count != 1 else ''} submitted for validation"
     }
@@ -121,26 +205,166 @@ def upload_pdfs():
     return jsonify(response), 200
 
 
+def parse_date_param(value, end_of_day=False):
+    # Accepts "YYYY-MM-DD" or a full ISO timestamp; a bare date as upper bound covers the whole day.
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1) - timedelta(microseconds=1)
+    return parsed
+
+
+def validation_filters(args):
+    clauses, params = [], []
+    if args.get("status"):
+        clauses.append("v.status = %s")
+        params.append(args["status"])
+    if args.get("category_id"):
+        clauses.append("p.category_id = %s")
+        params.append(int(args["category_id"]))
+    if args.get("date_from"):
+        clauses.append("v.created_at >= %s")
+        params.append(parse_date_param(args["date_from"]))
+    if args.get("date_to"):
+        clauses.append("v.created_at <= %s")
+        params.append(parse_date_param(args["date_to"], end_of_day=True))
+    return clauses, params
+
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(f"{row['date'].isoformat()}|{row['id']}".encode()).decode()
+
+
+def decode_cursor(cursor_token):
+    created_at, validation_id = base64.urlsafe_b64decode(cursor_token.encode()).decode().split("|")
+    return datetime.fromisoformat(created_at), int(validation_id)
+
+
 @app.route('/validations', methods=['GET'])
 def get_validations():
+    # Keyset pagination, newest first: the cursor is the (created_at, id) of the last row served,
+    # so every page is an index range scan on idx_validations_created regardless of depth.
+    try:
+        limit = min(max(int(request.args.get("limit", VALIDATIONS_PAGE_SIZE)), 1), VALIDATIONS_MAX_PAGE_SIZE)
+        clauses, params = validation_filters(request.args)
+        if request.args.get("cursor"):
+            created_at, validation_id = decode_cursor(request.args["cursor"])
+            clauses.append("(v.created_at < %s OR (v.created_at = %s AND v.id < %s))")
+            params.extend([created_at, created_at, validation_id])
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
     try:
-        conn = get_db_connection()
+        conn = get_request_db()
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT
                 v.id AS id,
+                p.id AS certificate_id,
                 p.filename AS certificate_name,
                 c.name AS category_name,
                 v.status AS status,
                 v.created_at AS date
             FROM validations v
             JOIN parsed_pdfs p ON v.certificate_id = p.id
-            JOIN categories c ON p.category = c.name;
-        """)
+            JOIN categories c ON p.category_id = c.id
+            {where}
+            ORDER BY v.created_at DESC, v.id DESC
+            LIMIT %s
+        """, params + [limit + 1])
         validations = cursor.fetchall()
         cursor.close()
-        conn.close()
-        return jsonify(validations), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    has_more = len(validations) > limit
+    validations = validations[:limit]
+    return jsonify({
+        "items": validations,
+        "next_cursor": encode_cursor(validations[-1]) if has_more else None
+    }), 200
+
+
+@app.route('/validations/count', methods=['GET'])
+def count_validations():
+    try:
+        clauses, params = validation_filters(request.args)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    try:
+        conn = get_request_db()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT COUNT(*)
+            FROM validations v
+            JOIN parsed_pdfs p ON v.certificate_id = p.id
+            JOIN categories c ON p.category_id = c.id
+            {where}
+        """, params)
+        count = cursor.fetchone()[0]
+        cursor.close()
+        return jsonify({"count": count}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/validations/stream', methods=['GET'])
+def stream_validations():
+    # Server-sent events: one "progress" event per stage transition, from the in-process hub.
+    # Optional ?pdf_id=1,2,3 limits the stream to those certificates.
+    try:
+        wanted = {int(v) for v in request.args.get("pdf_id", "").split(",") if v.strip()}
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+
+    hub = get_progress_hub()
+    subscriber = hub.subscribe()
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"  # also how a closed connection is noticed
+                    continue
+                if wanted and event.get("pdf_id") not in wanted:
+                    continue
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@app.route("/parse_cache/stats", methods=["GET"])
+def get_parse_cache_stats():
+    try:
+        conn = get_request_db()
+        cursor = conn.cursor(dictionary=True)
+        # Rows linked to an earlier parse are cache hits; the rest were parsed by LlamaParse.
+        cursor.execute("""
+            SELECT
+                COALESCE(SUM(parsed_from_id IS NOT NULL), 0) AS hits,
+                COALESCE(SUM(parsed_from_id IS NULL AND ai_extracted_data IS NOT NULL), 0) AS misses
+            FROM parsed_pdfs
+            WHERE content_hash IS NOT NULL
+        """)
+        stats = cursor.fetchone()
+        cursor.close()
+        hits, misses = int(stats["hits"]), int(stats["misses"])
+        total = hits + misses
+        return jsonify({
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -151,9 +375,25 @@ def validate_pdf():
     return jsonify({"message": "Validate endpoint hit, logic to be implemented."}), 200
 
 
+def category_norm_response(body, etag):
+    response = app.response_class(body, status=200, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"private, max-age={CATEGORY_CACHE_MAX_AGE}, must-revalidate"
+    # Turns into 304 Not Modified when If-None-Match carries the current ETag.
+    return response.make_conditional(request)
+
+
 @app.route("/category/<string:category_id>", methods=["GET"])
 def get_category_norm(category_id):
-    conn = get_db_connection()
+    # Norms only change through /prop_update, so the rendered JSON is kept until the norms version moves.
+    responses = get_norms_response_cache()
+    cached = responses.get(category_id)
+    if cached is not None:
+        etag, body = cached
+        return category_norm_response(body, etag)
+    version = responses.norms.version()
+
+    conn = get_request_db()
     if not conn:
         return jsonify({"error": "Due to technical reasons, the server can't be reached."}), 500
     cursor = conn.cursor(dictionary=True)
@@ -225,18 +465,19 @@ def get_category_norm(category_id):
                 "mechanical_properties": mech_map.get(m["grade_id"], [])
             })
 
-        return jsonify({
+        body = jsonify({
             "message": "Successfully retrieved category norms.",
             "category": materials[0]["category_name"],
             "materials": result
-        }), 200
+        }).get_data()
+        etag = responses.put(category_id, body, version)
+        return category_norm_response(body, etag)
 
     except Exception as e:
         return jsonify({"error": f"Failed to retrieve category norms: {str(e)}"}), 500
 
     finally:
         cursor.close()
-        conn.close()
 
 
 @app.route("/prop_update", methods=["PUT"])
@@ -246,7 +487,7 @@ def update_property():
     if not data or ('cprop_id' not in data and 'mprop_id' not in data):
         return jsonify({"error": "Missing required field: cprop_id or mprop_id"}), 400
 
-    conn = get_db_connection()
+    conn = get_request_db()
     if not conn:
         return jsonify({"error": "Due to technical reasons, the server can't be reached."}), 500
     cursor = conn.cursor(dictionary=True)
@@ -281,20 +522,38 @@ def update_property():
                 data["mprop_id"]
             ))
 
+        updated = cursor.rowcount
+        if updated:
+            # Other processes notice the new version and drop their cached norms.
+            bump_norms_version(cursor)
         conn.commit()
+        get_norms_cache().invalidate()
+        get_norms_response_cache().invalidate()
 
-        if cursor.rowcount == 0:
+        if updated == 0:
             return jsonify({"error": "Property not found or no changes made."}), 404
 
-        return jsonify({"message": "Property updated successfully."}), 200
+        # Certificates of the edited grade are re-compared from their stored values, no LLM involved.
+        table, prop_id = ("chemical_properties", data["cprop_id"]) if 'cprop_id' in data else ("mechanical_properties", data["mprop_id"])
+        cursor.execute(f"SELECT grade_id FROM {table} WHERE id = %s", (prop_id,))
+        row = cursor.fetchone()
+        revalidated = 0
+        if row:
+            try:
+                revalidated = len(revalidate_grade(row["grade_id"]))
+            except Exception as e:
+                print(f"⚠️ Re-validation for grade {row['grade_id']} failed: {e}")
+
+        return jsonify({"message": "Property updated successfully.", "revalidated": revalidated}), 200
 
     except Exception as e:
         return jsonify({"error": f"Update failed: {str(e)}"}), 500
 
     finally:
         cursor.close()
-        conn.close()
 
 
 if __name__ == "__main__":
+    ensure_schema()
+    warm_norms_cache()
     app.run(debug=True, host="0.0.0.0", port=5000)
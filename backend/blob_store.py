@@ -0,0 +1,254 @@
+import os
+import re
+import mmap
+import time
+import uuid
+import hashlib
+import logging
+import argparse
+import threading
+from io import BytesIO
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from db import db_cursor, db_connection
+from schema import column_exists
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "local")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "blobs"))
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", 3600))
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+def check_digest(digest):
+    if not isinstance(digest, str) or not _DIGEST_RE.fullmatch(digest):
+        raise ValueError(f"Invalid blob digest: {digest!r}")
+    return digest
+
+# === Writer ===
+class BlobWriter:
+    # Streams bytes into a staging file while hashing them; commit() publishes it under its digest.
+    def __init__(self, store, staging_path):
+        self._store = store
+        self._staging_path = staging_path
+        self._file = open(staging_path, "wb")
+        self._sha = hashlib.sha256()
+        self.size = 0
+        self.digest = None
+
+    def write(self, data):
+        self._sha.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.digest = self._sha.hexdigest()
+        self._store._install(self._staging_path, self.digest)
+        return self.digest
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if self.digest is None and os.path.exists(self._staging_path):
+            os.remove(self._staging_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.abort()
+        return False
+
+# === Backends ===
+class BlobStore:
+    def open_writer(self):
+        raise NotImplementedError
+
+    def open(self, digest):
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+    def iter_blobs(self):
+        # Yields (digest, last_modified_epoch) for every stored blob.
+        raise NotImplementedError
+
+    def iter_stale_staging(self, older_than):
+        return iter(())
+
+    @contextmanager
+    def open_mapped(self, digest):
+        # Read-only view of a blob for local parsing; backends without local files stream it instead.
+        with self.open(digest) as f:
+            yield f
+
+    def put_stream(self, fileobj):
+        with self.open_writer() as writer:
+            for chunk in iter(lambda: fileobj.read(BLOB_CHUNK_SIZE), b""):
+                writer.write(chunk)
+            return writer.commit()
+
+    def put_file(self, path):
+        with open(path, "rb") as f:
+            return self.put_stream(f)
+
+    def put_bytes(self, data):
+        return self.put_stream(BytesIO(data))
+
+
+class LocalBlobStore(BlobStore):
+    # Blobs live at <root>/<aa>/<bb>/<sha256>; partial writes stay in <root>/tmp until committed.
+    def __init__(self, root):
+        self.root = root
+        self.staging_dir = os.path.join(root, "tmp")
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def path(self, digest):
+        check_digest(digest)
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def open_writer(self):
+        return BlobWriter(self, os.path.join(self.staging_dir, f"{uuid.uuid4().hex}.part"))
+
+    def _install(self, staging_path, digest):
+        final_path = self.path(digest)
+        if os.path.exists(final_path):
+            # Same content already stored; refresh mtime so GC treats it as recently used.
+            os.remove(staging_path)
+            os.utime(final_path)
+            return
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(staging_path, final_path)
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    @contextmanager
+    def open_mapped(self, digest):
+        # pypdf seeks around the whole file; a mapping lets it read pages without copying the blob.
+        with open(self.path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield f  # empty files cannot be mapped
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_blobs(self):
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if _DIGEST_RE.fullmatch(name):
+                    yield name, os.path.getmtime(os.path.join(dirpath, name))
+
+    def iter_stale_staging(self, older_than):
+        for name in os.listdir(self.staging_dir):
+            path = os.path.join(self.staging_dir, name)
+            if os.path.getmtime(path) < older_than:
+                yield path
+
+
+BLOB_BACKENDS = {
+    "local": lambda: LocalBlobStore(BLOB_STORE_DIR),
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_blob_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BLOB_STORE_BACKEND not in BLOB_BACKENDS:
+                    raise ValueError(f"Unknown BLOB_STORE_BACKEND: {BLOB_STORE_BACKEND}")
+                _store = BLOB_BACKENDS[BLOB_STORE_BACKEND]()
+    return _store
+
+# === Maintenance ===
+def collect_garbage(store=None, grace_seconds=BLOB_GC_GRACE_SECONDS, dry_run=False):
+    # Removes blobs no parsed_pdfs row references. The grace period protects uploads whose
+    # row is not committed yet.
+    store = store or get_blob_store()
+    with db_cursor() as cursor:
+        cursor.execute("SELECT DISTINCT content_hash FROM parsed_pdfs WHERE content_hash IS NOT NULL")
+        referenced = {row[0] for row in cursor.fetchall()}
+
+    cutoff = time.time() - grace_seconds
+    removed = kept = 0
+    for digest, mtime in list(store.iter_blobs()):
+        if digest in referenced or mtime >= cutoff:
+            kept += 1
+            continue
+        if not dry_run:
+            store.delete(digest)
+        removed += 1
+
+    staging = list(store.iter_stale_staging(cutoff))
+    if not dry_run:
+        for path in staging:
+            os.remove(path)
+
+    logging.info(f"🧹 Blob GC: removed {removed}, kept {kept}, stale staging files {len(staging)}")
+    return {"removed": removed, "kept": kept, "staging_removed": len(staging), "dry_run": dry_run}
+
+def migrate_file_data(store=None):
+    # Moves legacy parsed_pdfs.file_data LONGBLOBs into the store, one row at a time.
+    store = store or get_blob_store()
+    migrated = 0
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if not column_exists(cursor, "parsed_pdfs", "file_data"):
+            cursor.close()
+            return migrated  # created after the blob store: nothing to move
+        cursor.execute("SELECT id FROM parsed_pdfs WHERE file_data IS NOT NULL")
+        ids = [row[0] for row in cursor.fetchall()]
+        for pdf_id in ids:
+            cursor.execute("SELECT file_data FROM parsed_pdfs WHERE id = %s", (pdf_id,))
+            data = cursor.fetchone()[0]
+            digest = store.put_bytes(bytes(data))
+            cursor.execute("""
+                UPDATE parsed_pdfs SET content_hash = %s, file_data = NULL WHERE id = %s
+            """, (digest, pdf_id))
+            conn.commit()
+            migrated += 1
+        cursor.close()
+    logging.info(f"📦 Migrated {migrated} PDFs from parsed_pdfs.file_data to the blob store")
+    return migrated
+
+# === CLI ===
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Blob store maintenance")
+    commands = cli.add_subparsers(dest="command", required=True)
+    gc_cmd = commands.add_parser("gc", help="delete blobs no parsed_pdfs row references")
+    gc_cmd.add_argument("--dry-run", action="store_true")
+    gc_cmd.add_argument("--grace-seconds", type=int, default=BLOB_GC_GRACE_SECONDS)
+    commands.add_parser("migrate", help="move parsed_pdfs.file_data into the blob store")
+    args = cli.parse_args()
+
+    if args.command == "gc":
+        print("🧹", collect_garbage(grace_seconds=args.grace_seconds, dry_run=args.dry_run))
+    elif args.command == "migrate":
+        print(f"📦 Migrated {migrate_file_data()} PDFs.")
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import argparse
+import logging
+from dotenv import load_dotenv
+from db import db_cursor
+from schema import ensure_schema
+from blob_store import get_blob_store
+from bulk_runner import BulkRun, load_manifest, print_run_summary, add_run_arguments, reset_manifest
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+BULK_INGEST_WORKERS = int(os.getenv("BULK_INGEST_WORKERS", os.cpu_count() or 4))
+BULK_INGEST_MANIFEST = os.getenv("BULK_INGEST_MANIFEST", "bulk_ingest.jsonl")
+BULK_INGEST_BATCH = int(os.getenv("BULK_INGEST_BATCH", 50))
+
+# Ingests a directory tree of supplier PDFs (one sub-folder per category). Pool workers store
+# each file in the blob store, which yields its content hash; hashes already in parsed_pdfs
+# are duplicates, and a hash met again while its first file is still parsing waits for that
+# file. Parsed files are inserted in batches, one transaction each. Every file's outcome is
+# appended to a JSONL manifest once it is final, so an interrupted run resumes where it stopped
+# (see bulk_runner.py).
+DONE_STATUSES = {"parsed", "duplicate"}
+
+# === Discovery ===
+def iter_directory_pdfs(input_dir):
+    # (path, category) for every PDF in the category sub-folders; files in the root are skipped as before.
+    for root, _, files in os.walk(input_dir):
+        if root == input_dir:
+            continue
+        category = os.path.basename(root)
+        for file in sorted(files):
+            if file.lower().endswith(".pdf"):
+                yield os.path.join(root, file), category
+
+def load_known_hashes():
+    # Same rule as the parse cache: only rows that hold parsed text count as already ingested.
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT content_hash, MIN(id) FROM parsed_pdfs
+            WHERE content_hash IS NOT NULL
+              AND parsed_from_id IS NULL
+              AND ai_extracted_data IS NOT NULL AND ai_extracted_data <> ''
+              AND parse_failed_pages IS NULL
+            GROUP BY content_hash
+        """)
+        return dict(cursor.fetchall())
+
+# === Worker ===
+def store_one(path):
+    # Runs in a pool process: hashing and the fsync'd copy into the blob store.
+    return get_blob_store().put_file(path)
+
+def parse_one(content_hash, filename):
+    # Runs in a pool process; the LlamaParse client and blob store are created per process.
+    from pdf_parser import parse_pages
+    from pdf_pages import merge_pages
+
+    start = time.monotonic()
+    with get_blob_store().open_mapped(content_hash) as pdf_stream:
+        pages, failed_pages = parse_pages(pdf_stream, filename)
+    if failed_pages:
+        # Not inserted: the file stays an error in the manifest and is parsed again on the next run.
+        raise RuntimeError(f"pages {failed_pages} failed to parse")
+    return {"pages": pages, "text": merge_pages(pages), "seconds": round(time.monotonic() - start, 3)}
+
+# === Batched Inserts ===
+def insert_parsed_batch(batch):
+    # batch: [(entry, parsed)]; one transaction for the rows and all their pages. Sets entry["pdf_id"].
+    page_rows = []
+    with db_cursor(commit=True) as cursor:
+        for entry, parsed in batch:
+            cursor.execute("""
+                INSERT INTO parsed_pdfs (filename, category, category_id, ai_extracted_data, content_hash)
+                VALUES (%s, %s, (SELECT id FROM categories WHERE name = %s), %s, %s)
+            """, (os.path.basename(entry["path"]), entry["category"], entry["category"], parsed["text"], entry["hash"]))
+            entry["pdf_id"] = cursor.lastrowid
+            page_rows += [(entry["pdf_id"], page_no, source, text) for page_no, source, text in parsed["pages"]]
+        if page_rows:
+            cursor.executemany("""
+                INSERT INTO parsed_pdf_pages (pdf_id, page_no, source, text)
+                VALUES (%s, %s, %s, %s)
+            """, page_rows)
+
+# === Runner ===
+def run_bulk_ingest(files, manifest_path=BULK_INGEST_MANIFEST, workers=BULK_INGEST_WORKERS,
+                    batch_size=BULK_INGEST_BATCH, retry_errors=True):
+    ensure_schema()
+    done = load_manifest(manifest_path, "path", DONE_STATUSES, retry_errors)
+    pending = [(path, category) for path, category in files if path not in done]
+    run = BulkRun(manifest_path, workers, len(pending), len(files) - len(pending),
+                  {"parsed": "✅", "duplicate": "♻️", "error": "⚠️"})
+    run.summary["pages"] = 0
+    print(f"🚀 Ingesting {len(pending)} PDF(s) with {workers} worker(s), {len(files) - len(pending)} already in the manifest")
+
+    known = load_known_hashes()
+    # Hashes parsing in this run -> duplicates seen meanwhile, settled when the first file is.
+    waiting = {}
+    batch = []
+
+    def settle(entry):
+        # Records a file and the duplicates that waited for it: linked to its row, or errors to retry.
+        run.record(entry, entry["path"])
+        for duplicate in waiting.pop(entry["hash"], []):
+            if entry["status"] == "parsed":
+                run.record({**duplicate, "status": "duplicate", "pdf_id": entry["pdf_id"]}, duplicate["path"])
+            else:
+                run.record({**duplicate, "status": "error", "error": f"duplicate of {entry['path']}, which failed"},
+                           duplicate["path"])
+
+    def flush():
+        if not batch:
+            return
+        try:
+            insert_parsed_batch(batch)
+        except Exception as e:
+            logging.error(f"❌ Bulk insert of {len(batch)} row(s) failed: {e}")
+            for entry, _ in batch:
+                entry.update(status="error", error=f"insert failed: {e}")
+        for entry, parsed in batch:
+            if entry["status"] == "parsed":
+                known[entry["hash"]] = entry["pdf_id"]
+                run.summary["pages"] += len(parsed["pages"])
+            settle(entry)
+        batch.clear()
+
+    def start(item):
+        path, category = item
+        run.submit(("store", {"path": path, "category": category}), store_one, path)
+
+    def stored(entry, content_hash):
+        entry["hash"] = content_hash
+        if content_hash in known:
+            run.record({**entry, "status": "duplicate", "pdf_id": known[content_hash]}, entry["path"])
+        elif content_hash in waiting:
+            waiting[content_hash].append(entry)
+        else:
+            waiting[content_hash] = []
+            run.submit(("parse", entry), parse_one, content_hash, os.path.basename(entry["path"]))
+
+    def finish(context, future):
+        stage, entry = context
+        try:
+            result = future.result()
+        except Exception as e:
+            entry.update(status="error", error=str(e))
+            if stage == "parse":
+                settle(entry)
+            else:
+                run.record(entry, entry["path"])
+            return
+        if stage == "store":
+            stored(entry, result)
+            return
+        entry.update(status="parsed", seconds=result["seconds"])
+        batch.append((entry, result))
+        if len(batch) >= batch_size:
+            flush()
+
+    return run.run(pending, start, finish, on_stop=flush)
+
+def print_summary(summary):
+    print_run_summary("Bulk ingest", summary,
+                      f"parsed: {summary['parsed']} ({summary['pages']} pages)  "
+                      f"duplicates: {summary['duplicate']}  errors: {summary['error']}")
+
+# === CLI ===
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Parse a directory tree of PDFs (one sub-folder per category) in parallel")
+    cli.add_argument("input_dir")
+    cli.add_argument("--batch-size", type=int, default=BULK_INGEST_BATCH, help="parsed files per insert transaction")
+    add_run_arguments(cli, BULK_INGEST_WORKERS, BULK_INGEST_MANIFEST)
+    args = cli.parse_args()
+
+    files = list(iter_directory_pdfs(args.input_dir))
+    if not files:
+        print("❌ No PDFs found in category folders.")
+        sys.exit(1)
+
+    reset_manifest(args)
+    summary = run_bulk_ingest(files, args.manifest, args.workers, args.batch_size, retry_errors=not args.no_retry_errors)
+    print_summary(summary)
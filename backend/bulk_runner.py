@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Resumable bulk runs over a process pool, shared by bulk_ingest.py and bulk_validate.py.
+# Items are fed from an iterator with at most two tasks per worker queued, so an interrupt
+# loses little work. Every final outcome is appended to a JSONL manifest, and a rerun skips
+# what it already holds.
+
+# === Manifest ===
+def load_manifest(path, key, done_statuses, retry_errors=True):
+    # {entry[key]: entry} for the entries a rerun skips; errored ones too unless retry_errors.
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by the interruption
+            if entry.get("status") in done_statuses or not retry_errors:
+                done[entry[key]] = entry
+    return done
+
+# === Runner ===
+class BulkRun:
+    def __init__(self, manifest_path, workers, total, skipped, icons):
+        # icons: {status: emoji}; every status starts at zero in the summary.
+        self.manifest_path = manifest_path
+        self.workers = workers
+        self.icons = icons
+        self.summary = {"total": total, "skipped": skipped, **{status: 0 for status in icons}}
+        self.completed = 0
+        self.in_flight = {}
+        self._executor = None
+        self._manifest = None
+        self._start = None
+
+    def submit(self, context, fn, *args):
+        self.in_flight[self._executor.submit(fn, *args)] = context
+
+    def record(self, entry, label):
+        # Appends a final outcome to the manifest and prints a progress line.
+        self.completed += 1
+        self.summary[entry["status"]] += 1
+        if self._manifest:
+            self._manifest.write(json.dumps(entry) + "\n")
+            self._manifest.flush()
+        rate = self.completed / max(time.monotonic() - self._start, 1e-9)
+        took = f" in {entry['seconds']:.1f}s" if entry.get("seconds") else ""
+        print(f"{self.icons[entry['status']]} [{self.completed}/{self.summary['total']}] {label} {entry['status']}"
+              f"{took} ({rate:.2f}/s)" + (f": {entry['error']}" if entry.get("error") else ""))
+
+    def run(self, items, start, finish, on_stop=None):
+        # start(item) submits an item's first task; finish(context, future) handles a finished task
+        # and may submit follow-ups. on_stop runs before the manifest closes, also on interrupt.
+        self._start = time.monotonic()
+        self._manifest = open(self.manifest_path, "a", encoding="utf-8") if self.manifest_path else None
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        items = iter(items)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(self.in_flight) < self.workers * 2:
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                    else:
+                        start(item)
+                if not self.in_flight:
+                    break
+                finished, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(self.in_flight.pop(future), future)
+        except KeyboardInterrupt:
+            print("\n🛑 Interrupted; finished items are in the manifest, rerun to resume.")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        finally:
+            if on_stop:
+                on_stop()
+            if self._executor:
+                self._executor.shutdown(wait=True)
+            if self._manifest:
+                self._manifest.close()
+
+        elapsed = time.monotonic() - self._start
+        self.summary.update({
+            "completed": self.completed,
+            "elapsed_seconds": round(elapsed, 1),
+            "per_second": round(self.completed / elapsed, 3) if elapsed else 0.0
+        })
+        return self.summary
+
+def print_run_summary(title, summary, counts):
+    print(f"\n📊 {title} summary")
+    print(f"   completed: {summary['completed']}/{summary['total']} (skipped from the manifest: {summary['skipped']})")
+    print(f"   {counts}")
+    print(f"   elapsed: {summary['elapsed_seconds']}s  throughput: {summary['per_second']}/s")
+    logging.info(f"📊 {title} summary: {summary}")
+
+# === CLI ===
+def add_run_arguments(cli, workers, manifest, manifest_flag="--manifest"):
+    cli.add_argument("--workers", type=int, default=workers)
+    cli.add_argument(manifest_flag, dest="manifest", default=manifest, help="JSONL manifest to resume from")
+    cli.add_argument("--fresh", action="store_true", help="ignore and overwrite an existing manifest")
+    cli.add_argument("--no-retry-errors", action="store_true", help="do not retry items that errored last time")
+
+def reset_manifest(args):
+    if args.fresh and args.manifest and os.path.exists(args.manifest):
+        os.remove(args.manifest)
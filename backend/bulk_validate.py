@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+from db import db_cursor
+from bulk_runner import BulkRun, load_manifest, print_run_summary, add_run_arguments, reset_manifest
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+BULK_VALIDATE_WORKERS = int(os.getenv("BULK_VALIDATE_WORKERS", os.cpu_count() or 4))
+BULK_VALIDATE_CHECKPOINT = os.getenv("BULK_VALIDATE_CHECKPOINT", "bulk_validate.jsonl")
+
+# Runs extract_and_compare over many certificates in a process pool (see bulk_runner.py).
+# Every finished id is appended to a JSONL checkpoint, so an interrupted run skips what already completed.
+DONE_STATUSES = {"passed", "failed"}
+
+# === Selection ===
+def select_pdf_ids(category=None, since=None, until=None, unvalidated=False):
+    clauses, params = ["p.ai_extracted_data IS NOT NULL OR p.parsed_from_id IS NOT NULL"], []
+    if category:
+        clauses.append("p.category = %s")
+        params.append(category)
+    if since:
+        clauses.append("p.created_at >= %s")
+        params.append(since)
+    if until:
+        clauses.append("p.created_at < %s")
+        params.append(until)
+    if unvalidated:
+        clauses.append("NOT EXISTS (SELECT 1 FROM validations v WHERE v.certificate_id = p.id)")
+    with db_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT p.id FROM parsed_pdfs p
+            WHERE {' AND '.join(f'({c})' for c in clauses)}
+            ORDER BY p.id
+        """, params)
+        return [row[0] for row in cursor.fetchall()]
+
+# === Worker ===
+def validate_one(pdf_id):
+    # Runs in a pool process; db, LLM client and norms cache are created per process.
+    from validate import extract_and_compare
+
+    start = time.monotonic()
+    try:
+        result = extract_and_compare(pdf_id)
+        if result is None:
+            status, error = "error", "extraction failed"
+        else:
+            status, error = ("passed" if result[2] else "failed"), None
+    except Exception as e:
+        status, error = "error", str(e)
+    return {"pdf_id": pdf_id, "status": status, "seconds": round(time.monotonic() - start, 3), "error": error}
+
+# === Runner ===
+def run_bulk_validation(pdf_ids, checkpoint_path=BULK_VALIDATE_CHECKPOINT, workers=BULK_VALIDATE_WORKERS,
+                        retry_errors=True, on_progress=None):
+    done = load_manifest(checkpoint_path, "pdf_id", DONE_STATUSES, retry_errors)
+    pending = [pdf_id for pdf_id in dict.fromkeys(pdf_ids) if pdf_id not in done]
+    run = BulkRun(checkpoint_path, workers, len(pending), len(pdf_ids) - len(pending),
+                  {"passed": "✅", "failed": "❌", "error": "⚠️"})
+    print(f"🚀 Validating {len(pending)} certificate(s) with {workers} worker(s), {len(pdf_ids) - len(pending)} already done")
+
+    def finish(pdf_id, future):
+        try:
+            outcome = future.result()
+        except Exception as e:  # the worker process itself died
+            outcome = {"pdf_id": pdf_id, "status": "error", "seconds": 0.0, "error": repr(e)}
+        run.record(outcome, f"pdf {pdf_id}")
+        if on_progress:
+            on_progress(outcome, run.completed, len(pending))
+
+    return run.run(pending, lambda pdf_id: run.submit(pdf_id, validate_one, pdf_id), finish)
+
+def print_summary(summary):
+    print_run_summary("Bulk validation", summary,
+                      f"passed: {summary['passed']}  failed: {summary['failed']}  errors: {summary['error']}")
+
+# === CLI ===
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Validate many parsed certificates in parallel")
+    cli.add_argument("ids", nargs="*", type=int, help="parsed_pdfs ids (default: select with the filters below)")
+    cli.add_argument("--ids-file", help="file with one parsed_pdfs id per line")
+    cli.add_argument("--category", help="only certificates uploaded under this category")
+    cli.add_argument("--since", help="only certificates created at or after this date")
+    cli.add_argument("--until", help="only certificates created before this date")
+    cli.add_argument("--unvalidated", action="store_true", help="only certificates without a validation row")
+    add_run_arguments(cli, BULK_VALIDATE_WORKERS, BULK_VALIDATE_CHECKPOINT, manifest_flag="--checkpoint")
+    args = cli.parse_args()
+
+    pdf_ids = list(args.ids)
+    if args.ids_file:
+        with open(args.ids_file, encoding="utf-8") as f:
+            pdf_ids += [int(line) for line in f if line.strip()]
+    if not pdf_ids:
+        pdf_ids = select_pdf_ids(args.category, args.since, args.until, args.unvalidated)
+    if not pdf_ids:
+        print("❌ No certificates selected.")
+        sys.exit(1)
+
+    reset_manifest(args)
+    summary = run_bulk_validation(pdf_ids, args.manifest, args.workers, retry_errors=not args.no_retry_errors)
+    print_summary(summary)
@@ -0,0 +1,250 @@
+import os
+import re
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+LOCAL_CHEM_EXTRACTION = os.getenv("LOCAL_CHEM_EXTRACTION", "true").lower() in ("1", "true", "yes")
+CHEM_TABLE_MIN_ELEMENTS = int(os.getenv("CHEM_TABLE_MIN_ELEMENTS", 3))
+CHEM_TABLE_MAX_ROWS = 12
+CHEM_INLINE_CONTEXT_LINES = 6
+
+# Deterministic chemistry extraction from LlamaParse text. Composition tables are found by
+# their header (a line with several element columns) and value rows are aligned to it; an
+# element is only reported when every value found for it parses as a plausible percentage.
+# Inline "C = 0.18" values count only with a % sign or under a chemical-analysis heading.
+# Anything else is left for the LLM.
+
+# === Elements ===
+ELEMENTS = {
+    "C": "carbon", "Si": "silicon", "Mn": "manganese", "P": "phosphorus", "S": "sulfur",
+    "Cr": "chromium", "Ni": "nickel", "Mo": "molybdenum", "Cu": "copper", "V": "vanadium",
+    "Nb": "niobium", "Ti": "titanium", "Al": "aluminium", "N": "nitrogen", "B": "boron",
+    "Co": "cobalt", "W": "tungsten", "Sn": "tin", "Pb": "lead", "As": "arsenic",
+    "Sb": "antimony", "Ca": "calcium", "Zr": "zirconium", "Bi": "bismuth", "H": "hydrogen",
+    "O": "oxygen", "Mg": "magnesium", "Se": "selenium", "Ta": "tantalum", "Fe": "iron",
+    "Zn": "zinc", "Te": "tellurium"
+}
+# Upper bound (wt.%) a certificate value can plausibly have, steels and cast irons included;
+# anything above it is a misread (a temperature, a ppm figure) and goes to the LLM.
+MAX_PERCENT = {
+    "C": 5, "Si": 5, "Mn": 30, "P": 1, "S": 1, "Cr": 35, "Ni": 40, "Mo": 10, "Cu": 10,
+    "V": 5, "Nb": 2, "Ti": 3, "Al": 5, "N": 1, "B": 0.1, "Co": 25, "W": 20, "Sn": 1,
+    "Pb": 1, "As": 1, "Sb": 1, "Ca": 1, "Zr": 1, "Bi": 1, "H": 0.01, "O": 0.1, "Mg": 1,
+    "Se": 1, "Ta": 2, "Fe": 100, "Zn": 1, "Te": 1
+}
+NAME_TO_SYMBOL = {name: symbol for symbol, name in ELEMENTS.items()}
+NAME_TO_SYMBOL.update({"aluminum": "Al", "sulphur": "S", "columbium": "Nb"})
+
+_HEADER_NOISE = re.compile(r"[%()\[\]*:]|wt\.?")
+_NUMBER = re.compile(r"^[<>≤≥]?\s*(\d+(?:[.,]\d+)?|[.,]\d+)$")
+_PLACEHOLDER = re.compile(r"^(?:-+|—|–|n\.?a\.?|/)$", re.IGNORECASE)
+_SEPARATOR_LINE = re.compile(r"^[\s|:+=_-]+$")
+_SCALE_DIVIDE = re.compile(r"(?:[x×*]\s*|1\s*/\s*)(10{1,4})(?![\d.])")
+_SCALE_POWER = re.compile(r"[x×*]\s*10\s*\^?\s*[-−]\s*(\d)")
+_COMPOSITION_HEADING = re.compile(
+    r"chemical|composition|analysis|analyse|ladle|heat\s+anal|cast\s+anal|chemische|zusammensetzung|schmelz",
+    re.IGNORECASE)
+_UNIT_AFTER = re.compile(r"\s*(?:J|MPa|N/mm|mm|°|K\b|HB|HV|HRC|kg|t\b|tons?\b|s\b|min\b|h\b)")
+_TEMPERATURE_BEFORE = re.compile(r"\d\s*°?\s*$")
+
+def header_key(token):
+    return _HEADER_NOISE.sub("", token).strip()
+
+def element_key(name):
+    # Catalogue element names ("C", "Carbon", "Mn %", "Cr+Mo+Ni") reduced to the header spelling.
+    key = header_key(str(name))
+    symbol = NAME_TO_SYMBOL.get(key.lower())
+    if symbol:
+        return symbol
+    for sym in ELEMENTS:
+        if key.lower() == sym.lower():
+            return sym
+    return key.replace(" ", "")
+
+def strip_scale(cell):
+    return _SCALE_DIVIDE.sub("", _SCALE_POWER.sub("", cell)).strip()
+
+def split_cells(line):
+    if "|" in line:
+        return [cell.strip() for cell in line.strip().strip("|").split("|")]
+    cells = re.split(r"\s+", line.strip())
+    # Unit and scale tokens ("%", "(x1000)") are not columns of their own.
+    return [cell for cell in cells if _NUMBER.match(cell) or header_key(strip_scale(cell))]
+
+def parse_number(cell):
+    match = _NUMBER.match(cell.strip())
+    if not match:
+        return None
+    return float(match.group(1).replace(",", "."))
+
+def value_like(cell):
+    return parse_number(cell) is not None or bool(_PLACEHOLDER.match(cell.strip()))
+
+def cell_scale(text):
+    # Factor of a "x100" / "x10^-3" marker in the text, or None when it has none.
+    power = _SCALE_POWER.search(text)
+    if power:
+        return 10 ** -int(power.group(1))
+    divide = _SCALE_DIVIDE.search(text)
+    if divide:
+        return 1 / int(divide.group(1))
+    return None
+
+def column_scales(header_line, header_cells, columns, piped):
+    # Scale factor per header cell. One marker in the header applies to the whole table; with
+    # several, every element column needs its own ("C x100 | P x1000"), else the table is
+    # ambiguous and None is returned.
+    if piped:
+        scales, orphans = [cell_scale(cell) for cell in header_cells], []
+    else:
+        scales, orphans = [], []
+        for token in re.split(r"\s+", header_line.strip()):
+            scale = cell_scale(token)
+            if _NUMBER.match(token) or header_key(strip_scale(token)):
+                scales.append(scale)
+            elif scale is not None:
+                # A separate "x100" token belongs to the column before it.
+                if scales and scales[-1] is None:
+                    scales[-1] = scale
+                else:
+                    orphans.append(scale)
+    markers = [scale for scale in scales + orphans if scale is not None]
+    if len(markers) <= 1:
+        return [markers[0] if markers else 1.0] * len(header_cells)
+    if orphans or any(col is not None and scale is None for col, scale in zip(columns, scales)):
+        return None
+    return [1.0 if scale is None else scale for scale in scales]
+
+# === Extractor ===
+class ChemistryExtractor:
+    def __init__(self, element_names):
+        self.element_names = list(element_names)
+        self.keys = {name: element_key(name) for name in self.element_names}
+        self.header_keys = set(ELEMENTS) | set(self.keys.values())
+        self.inline_patterns = {
+            name: re.compile(rf"(?<![A-Za-z]){re.escape(key)}\s*(\(?%\)?)?\s*[:=]\s*([<>≤≥]?\s*\d+(?:[.,]\d+)?)(\s*%)?")
+            for name, key in self.keys.items()
+        }
+
+    def _header_columns(self, cells):
+        columns = [header_key(strip_scale(cell)).replace(" ", "") for cell in cells]
+        columns = [col if col in self.header_keys else None for col in columns]
+        return columns if sum(col is not None for col in columns) >= CHEM_TABLE_MIN_ELEMENTS else None
+
+    def _align(self, header_cells, columns, cells, piped):
+        # -> [(header position, cell)]
+        if len(cells) == len(header_cells):
+            return list(enumerate(cells))
+        if piped:
+            return None
+        # Whitespace tables: leading label cells (heat no., "Ladle") may not line up with the
+        # header, but the element columns are the trailing block of the row.
+        first = next(i for i, col in enumerate(columns) if col is not None)
+        width = len(columns) - first
+        tail = cells[-width:]
+        if len(cells) < width or not all(value_like(cell) for cell in tail):
+            return None
+        return list(zip(range(first, len(columns)), tail))
+
+    def _tables(self, lines):
+        values, rejected = {}, set()
+        i = 0
+        while i < len(lines):
+            header_cells = split_cells(lines[i])
+            columns = self._header_columns(header_cells)
+            if not columns:
+                i += 1
+                continue
+
+            piped = "|" in lines[i]
+            scales = column_scales(lines[i], header_cells, columns, piped)
+            if scales is None:
+                # Mixed scale factors that cannot be tied to columns: leave these elements to the LLM.
+                rejected.update(col for col in columns if col)
+                i += 1
+                continue
+            rows = 0
+            i += 1
+            while i < len(lines) and rows < CHEM_TABLE_MAX_ROWS:
+                line = lines[i]
+                if not line.strip() or _SEPARATOR_LINE.match(line):
+                    i += 1
+                    if rows:
+                        break
+                    continue
+                cells = split_cells(line)
+                if self._header_columns(cells):
+                    break
+                if not any(parse_number(cell) is not None for cell in cells):
+                    if rows:
+                        break
+                    i += 1
+                    continue
+
+                aligned = self._align(header_cells, columns, cells, piped)
+                if aligned is None:
+                    rejected.update(col for col in columns if col)
+                else:
+                    for k, cell in aligned:
+                        col = columns[k]
+                        if col is None:
+                            continue
+                        number = parse_number(cell)
+                        if number is None:
+                            if not _PLACEHOLDER.match(cell.strip()):
+                                rejected.add(col)
+                            continue
+                        values.setdefault(col, []).append(round(number * scales[k], 6))
+                rows += 1
+                i += 1
+        return values, rejected
+
+    def _inline(self, lines, name):
+        # "C = 0.18" style values; only in a composition context, never a "-20 C: 45 J" reading.
+        key = self.keys[name]
+        numbers = []
+        heading_at = None
+        for i, line in enumerate(lines):
+            if _COMPOSITION_HEADING.search(line):
+                heading_at = i
+            near_heading = heading_at is not None and i - heading_at <= CHEM_INLINE_CONTEXT_LINES
+            for match in self.inline_patterns[name].finditer(line):
+                if _UNIT_AFTER.match(line, match.end()):
+                    continue
+                if key == "C" and _TEMPERATURE_BEFORE.search(line[:match.start()]):
+                    continue  # "-20 C: ..." is a test temperature
+                if match.group(1) or match.group(3) or near_heading:
+                    numbers.append(round(parse_number(match.group(2)), 6))
+        return numbers
+
+    def extract(self, text):
+        # Returns ([{"property_name", "value"}], [element names left for the LLM]).
+        lines = text.splitlines()
+        table_values, rejected = self._tables(lines)
+
+        found, missing = [], []
+        for name in self.element_names:
+            key = self.keys[name]
+            numbers = table_values.get(key, [])
+            if not numbers and key not in rejected:
+                numbers = self._inline(lines, name)
+            limit = MAX_PERCENT.get(key, 100)
+            if not numbers or not all(0 <= n <= limit for n in numbers):
+                missing.append(name)
+                continue
+            low, high = min(numbers), max(numbers)
+            found.append({"property_name": name, "value": str(low) if low == high else f"{low} - {high}"})
+        return found, missing
+
+def extract_local_chemistry(text, element_names):
+    if not LOCAL_CHEM_EXTRACTION or not text:
+        return [], list(element_names)
+    return ChemistryExtractor(element_names).extract(text)
+
+def merge_chemistry(local_items, llm_items):
+    # Locally extracted values win; the LLM only fills elements the tables did not resolve.
+    resolved = {item["property_name"] for item in local_items}
+    return local_items + [item for item in llm_items if item.get("property_name") not in resolved]
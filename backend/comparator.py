@@ -0,0 +1,157 @@
+import re
+import numpy as np
+import pandas as pd
+from norms_cache import get_norms_cache
+
+# Batch comparison of extracted values against standard limits. Samples from any number of
+# certificates are flattened into one frame, paired with their limit row from the norms cache
+# index and classified with NumPy masks; the per-certificate frames keep the historical columns.
+
+# === Results ===
+WITHIN = "WITHIN RANGE"
+PARTIAL = "PARTIALLY WITHIN RANGE"
+NOT_WITHIN = "NOT WITHIN RANGE"
+NO_LIMITS = "NO STANDARD LIMITS"
+INVALID = "INVALID SAMPLE VALUE"
+
+KINDS = {
+    "chemical": {"missing": "ELEMENT NOT FOUND IN STANDARD"},
+    "mechanical": {"missing": "NOT FOUND IN STANDARD"}
+}
+
+# === Sample Values ===
+def extract_value_range(value):
+    if isinstance(value, dict):
+        try:
+            min_val = value.get("min")
+            max_val = value.get("max")
+            return float(min_val) if min_val is not None else None, \
+                   float(max_val) if max_val is not None else None
+        except:
+            return None, None
+
+    if isinstance(value, (int, float)):
+        return float(value), float(value)
+
+    if isinstance(value, str):
+        value = value.replace(",", ".")
+        found = re.findall(r"[-+]?(?:\d*\.\d+|\d+)(?:[eE][-+]?\d+)?", value)
+        if len(found) == 1:
+            val = float(found[0])
+            return val, val
+        elif len(found) >= 2:
+            return float(found[0]), float(found[1])
+    return None, None
+
+def build_sample_frame(kind, items, norms, diameters):
+    # items: iterable of (key, grade_id, sample_data) -> one row per extracted value, with the
+    # applicable limit row picked through the norms cache index (diameter band where relevant).
+    keys, names, mins, maxs, std_mins, std_maxs, found = [], [], [], [], [], [], []
+    for key, grade_id, sample_data in items:
+        limits = norms[grade_id].limits(kind) if grade_id in norms else None
+        diameter = diameters.get(key)
+        for item in sample_data:
+            val_min, val_max = extract_value_range(item["value"])
+            row = limits.select(item["property_name"], diameter) if limits is not None else None
+            keys.append(key)
+            names.append(item["property_name"])
+            mins.append(np.nan if val_min is None else val_min)
+            maxs.append(np.nan if val_max is None else val_max)
+            found.append(row is not None)
+            std_mins.append(limits.min_values[row] if row is not None else np.nan)
+            std_maxs.append(limits.max_values[row] if row is not None else np.nan)
+    return pd.DataFrame({
+        "key": keys,
+        "name": pd.Series(names, dtype=object),
+        "val_min": np.asarray(mins, dtype=float),
+        "val_max": np.asarray(maxs, dtype=float),
+        "min_value": np.asarray(std_mins, dtype=float),
+        "max_value": np.asarray(std_maxs, dtype=float),
+        "found": np.asarray(found, dtype=bool)
+    })
+
+# === Classification ===
+def classify(frame, missing_label):
+    vmin = frame["val_min"].to_numpy(dtype=float)
+    vmax = frame["val_max"].to_numpy(dtype=float)
+    smin = frame["min_value"].to_numpy(dtype=float)
+    smax = frame["max_value"].to_numpy(dtype=float)
+
+    invalid = np.isnan(vmin) & np.isnan(vmax)
+    missing = ~frame["found"].to_numpy()
+    has_min = ~np.isnan(smin)
+    has_max = ~np.isnan(smax)
+    both = has_min & has_max
+
+    conditions = [
+        invalid,
+        missing,
+        both & (vmin >= smin) & (vmax <= smax),
+        both & ((vmax < smin) | (vmin > smax)),
+        both,
+        has_max & (vmax <= smax),
+        has_max,
+        has_min & (vmin >= smin),
+        has_min
+    ]
+    choices = [INVALID, missing_label, WITHIN, NOT_WITHIN, PARTIAL, WITHIN, NOT_WITHIN, WITHIN, NOT_WITHIN]
+    result = np.select(conditions, choices, default=NO_LIMITS)
+
+    no_standard = invalid | missing
+    return result, no_standard, np.where(no_standard, np.nan, smin), np.where(no_standard, np.nan, smax)
+
+def _nullable(values, none_mask):
+    # A column made only of missing values stays as None, like a frame built from records.
+    return [None] * len(values) if none_mask.all() else values
+
+def format_results(kind, frame):
+    val_min = frame["val_min"].to_numpy(dtype=float)
+    val_max = frame["val_max"].to_numpy(dtype=float)
+    no_standard = frame["no_standard"].to_numpy()
+    std_min = _nullable(frame["std_min"].to_numpy(), no_standard)
+    std_max = _nullable(frame["std_max"].to_numpy(), no_standard)
+    if kind == "chemical":
+        sample_value = [f"{lo} - {hi}" if not np.isnan(lo) else "None" for lo, hi in zip(val_min.tolist(), val_max.tolist())]
+        return pd.DataFrame({
+            "element": frame["name"].to_numpy(),
+            "sample_value": sample_value,
+            # Numeric bounds behind sample_value, for storage without re-parsing the display text.
+            "sample_min": val_min,
+            "sample_max": val_max,
+            "min_value": std_min,
+            "max_value": std_max,
+            "result": frame["result"].to_numpy()
+        })
+    return pd.DataFrame({
+        "property": frame["name"].to_numpy(),
+        "sample_min": _nullable(val_min, np.isnan(val_min)),
+        "sample_max": _nullable(val_max, np.isnan(val_max)),
+        "standard_min": std_min,
+        "standard_max": std_max,
+        "result": frame["result"].to_numpy()
+    })
+
+# === Batch API ===
+def compare_properties_batch(kind, items, diameters=None):
+    # items: iterable of (key, grade_id, sample_data); diameters: optional {key: product diameter in mm}.
+    # Returns {key: (result_df, all_within_range)}.
+    items = list(items)
+    norms = get_norms_cache().get_many([grade_id for _, grade_id, _ in items])
+    samples = build_sample_frame(kind, items, norms, diameters or {})
+    samples["result"], samples["no_standard"], samples["std_min"], samples["std_max"] = classify(samples, KINDS[kind]["missing"])
+
+    outcomes = {key: (pd.DataFrame([]), True) for key, _, _ in items}
+    for key, frame in samples.groupby("key", sort=False):
+        results = format_results(kind, frame)
+        outcomes[key] = (results, bool((results["result"] == WITHIN).all()))
+    return outcomes
+
+def compare_certificates_batch(extractions):
+    # extractions: {pdf_id: (grade_id, chem_data, mech_data, diameter)} -> {pdf_id: (chem_df, mech_df, all_ok)}
+    chem = compare_properties_batch("chemical", [(pdf_id, g, c) for pdf_id, (g, c, _, _) in extractions.items()])
+    mech = compare_properties_batch("mechanical", [(pdf_id, g, m) for pdf_id, (g, _, m, _) in extractions.items()],
+                                    diameters={pdf_id: d for pdf_id, (_, _, _, d) in extractions.items()})
+    return {
+        pdf_id: (chem[pdf_id][0], mech[pdf_id][0], chem[pdf_id][1] and mech[pdf_id][1])
+        for pdf_id in extractions
+    }
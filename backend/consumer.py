@@ -1,29 +1,245 @@
 import os
 import pika
 import json
-from pdf_parser import process_pdf  # Assuming this is the function to process the PDF
+import time
+import signal
+import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pdf_parser import process_pdf, process_blob, is_parsed, ParseFailed
+from validate import extract_and_compare
+from llm_client import LLMUnavailable
+from results_store import record_status
+from norms_cache import warm_norms_cache
+from schema import ensure_schema
+from progress_events import emit_progress, STAGE_PARSED, STAGE_ERROR
 
-def callback(ch, method, properties, body):
+# === Config ===
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "blocking")  # "blocking" (one at a time) or "threads"
+CONSUMER_CONCURRENCY = int(os.getenv("CONSUMER_CONCURRENCY", 8))
+CONSUMER_METRICS_INTERVAL = int(os.getenv("CONSUMER_METRICS_INTERVAL", 60))
+VALIDATE_AFTER_PARSE = os.getenv("VALIDATE_AFTER_PARSE", "true").lower() in ("1", "true", "yes")
+CONSUMER_MAX_RETRIES = int(os.getenv("CONSUMER_MAX_RETRIES", 3))
+PDF_QUEUE = "pdf_processing"
+FAILED_QUEUE = "pdf_processing_failed"
+
+def handle_message(body, attempt=0):
+    # Parse failures and an unreachable LLM raise, so the message is retried (see settle_failed).
     message = json.loads(body)
     print(f"Received message: {message}")
 
-    file_path = message['file_path']
     filename = message['filename']
     category = message['category']
 
-    process_pdf(file_path, category)
+    if message.get('pdf_id') and VALIDATE_AFTER_PARSE:
+        record_status(message['pdf_id'], "pending")
+
+    try:
+        if attempt and message.get('pdf_id') and is_parsed(message['pdf_id']):
+            # A retry after a validation failure: the parse is already stored.
+            print(f"♻️ {filename} already parsed, retrying validation only")
+            pdf_id = message['pdf_id']
+        elif 'content_hash' in message:
+            pdf_id = process_blob(message['content_hash'], filename, category, pdf_id=message.get('pdf_id'))
+        else:
+            # Messages queued before the blob store carried a local file path.
+            pdf_id = process_pdf(message['file_path'], category)
+    except ParseFailed as e:
+        failed_id = e.pdf_id or message.get('pdf_id')
+        if failed_id:
+            if VALIDATE_AFTER_PARSE:
+                record_status(failed_id, "error")
+            emit_progress(failed_id, STAGE_ERROR, reason=str(e))
+        raise
     print(f"Processing PDF {filename} (Category: {category})")
+    if pdf_id:
+        emit_progress(pdf_id, STAGE_PARSED)
+    elif message.get('pdf_id'):
+        emit_progress(message['pdf_id'], STAGE_ERROR, reason="parsing failed")
+
+    if pdf_id and VALIDATE_AFTER_PARSE:
+        # Extraction, comparison and the validations status are stored by extract_and_compare.
+        # The parse is already saved, so only an unreachable LLM retries the message.
+        try:
+            result = extract_and_compare(pdf_id)
+            if result is not None:
+                print(f"✅ Validated {filename}: {'passed' if result[2] else 'failed'}")
+        except LLMUnavailable as e:
+            logging.warning(f"⚠️ LLM unavailable for {filename} (pdf_id={pdf_id}): {e}")
+            record_status(pdf_id, "error")
+            emit_progress(pdf_id, STAGE_ERROR, reason="LLM unavailable")
+            raise
+        except Exception as e:
+            logging.exception(f"❌ Validation failed for {filename} (pdf_id={pdf_id}): {e}")
+            record_status(pdf_id, "error")
+            emit_progress(pdf_id, STAGE_ERROR, reason="validation failed")
+
+# === Retries ===
+# A failed message is republished with an incremented x-retry-count header after a backoff;
+# after CONSUMER_MAX_RETRIES attempts it is parked in FAILED_QUEUE instead of being dropped.
+# Republished messages are persistent, so they survive a broker restart in a durable queue.
+def retry_count(properties):
+    return int(((properties and properties.headers) or {}).get("x-retry-count", 0))
+
+def retry_delay(properties):
+    return min(2 ** retry_count(properties), 30)
+
+def declare_queues(channel):
+    channel.queue_declare(queue=PDF_QUEUE)
+    channel.queue_declare(queue=FAILED_QUEUE, durable=True)
 
+def settle_failed(channel, delivery_tag, body, properties):
+    # Must run on the connection thread. The republish happens before the ack, so a crash
+    # in between duplicates the message rather than losing it.
+    attempt = retry_count(properties) + 1
+    target = PDF_QUEUE if attempt <= CONSUMER_MAX_RETRIES else FAILED_QUEUE
+    channel.basic_publish(exchange='', routing_key=target, body=body,
+                          properties=pika.BasicProperties(delivery_mode=2, headers={"x-retry-count": attempt}))
+    channel.basic_ack(delivery_tag=delivery_tag)
+    if target == FAILED_QUEUE:
+        logging.error(f"❌ Message failed {attempt} times, moved to {FAILED_QUEUE}")
+    else:
+        logging.warning(f"🔁 Message requeued for attempt {attempt + 1}/{CONSUMER_MAX_RETRIES + 1}")
+
+def callback(ch, method, properties, body):
+    try:
+        handle_message(body, retry_count(properties))
+    except Exception as e:
+        logging.exception(f"❌ Message processing failed: {e}")
+        ch.connection.sleep(retry_delay(properties))
+        settle_failed(ch, method.delivery_tag, body, properties)
+        return
     ch.basic_ack(delivery_tag=method.delivery_tag)
 
 def consume_messages():
     connection = pika.BlockingConnection(pika.ConnectionParameters(os.getenv('RABBITMQ_HOST', 'localhost')))
     channel = connection.channel()
-    channel.queue_declare(queue='pdf_processing')
+    declare_queues(channel)
     channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue='pdf_processing', on_message_callback=callback)
+    channel.basic_consume(queue=PDF_QUEUE, on_message_callback=callback)
     print(" [*] Waiting for messages. To exit press CTRL+C")
     channel.start_consuming()
 
+# === Concurrent Mode ===
+class WorkerMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+
+    def record(self, seconds, ok):
+        name = threading.current_thread().name
+        with self._lock:
+            stats = self._workers.setdefault(name, {"processed": 0, "failed": 0, "busy_seconds": 0.0})
+            stats["processed" if ok else "failed"] += 1
+            stats["busy_seconds"] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._workers.items()}
+
+    def log(self):
+        for name, stats in sorted(self.snapshot().items()):
+            done = stats["processed"] + stats["failed"]
+            avg = stats["busy_seconds"] / done if done else 0.0
+            line = f"📊 {name}: processed={stats['processed']} failed={stats['failed']} avg={avg:.1f}s"
+            print(line)
+            logging.info(line)
+
+
+class ConcurrentConsumer:
+    # pika is not thread-safe: messages are handed to a thread pool, and every ack/nack is
+    # scheduled back onto the connection thread with add_callback_threadsafe. Prefetch matches
+    # the pool size so each worker always has a message ready.
+    def __init__(self, concurrency=CONSUMER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pdf-worker")
+        self.metrics = WorkerMetrics()
+        self.connection = None
+        self.channel = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stop_requested = False
+
+    def run(self):
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(os.getenv('RABBITMQ_HOST', 'localhost')))
+        self.channel = self.connection.channel()
+        declare_queues(self.channel)
+        self.channel.basic_qos(prefetch_count=self.concurrency)
+        self.channel.basic_consume(queue=PDF_QUEUE, on_message_callback=self._on_message)
+
+        # Signal handlers only set a flag; the connection thread notices it on its next tick.
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        self.connection.call_later(1, self._check_stop)
+        if CONSUMER_METRICS_INTERVAL > 0:
+            self.connection.call_later(CONSUMER_METRICS_INTERVAL, self._log_metrics)
+
+        print(f" [*] Waiting for messages with {self.concurrency} workers. To exit press CTRL+C")
+        try:
+            self.channel.start_consuming()
+        finally:
+            self._drain()
+
+    def _on_message(self, ch, method, properties, body):
+        with self._lock:
+            self._in_flight += 1
+        self.executor.submit(self._work, method.delivery_tag, body, properties)
+
+    def _work(self, delivery_tag, body, properties):
+        start = time.monotonic()
+        ok = True
+        try:
+            handle_message(body, retry_count(properties))
+        except Exception as e:
+            ok = False
+            logging.exception(f"❌ Message processing failed: {e}")
+            time.sleep(retry_delay(properties))  # backoff before the retry, on this worker
+        finally:
+            self.metrics.record(time.monotonic() - start, ok)
+            self.connection.add_callback_threadsafe(functools.partial(self._settle, delivery_tag, ok, body, properties))
+
+    def _settle(self, delivery_tag, ok, body, properties):
+        if ok:
+            self.channel.basic_ack(delivery_tag=delivery_tag)
+        else:
+            settle_failed(self.channel, delivery_tag, body, properties)
+        with self._lock:
+            self._in_flight -= 1
+
+    def _request_stop(self, signum, frame):
+        self._stop_requested = True
+
+    def _check_stop(self):
+        if self._stop_requested:
+            print(" [*] Stop requested, draining in-flight messages...")
+            self.channel.stop_consuming()
+        else:
+            self.connection.call_later(1, self._check_stop)
+
+    def _log_metrics(self):
+        self.metrics.log()
+        self.connection.call_later(CONSUMER_METRICS_INTERVAL, self._log_metrics)
+
+    def _drain(self):
+        # Consumption is cancelled; let running workers finish and flush their acks on this
+        # thread. Prefetched messages never started are returned to the queue on close.
+        while True:
+            with self._lock:
+                if self._in_flight == 0:
+                    break
+            self.connection.process_data_events(time_limit=0.5)
+        self.executor.shutdown(wait=True)
+        self.metrics.log()
+        if self.connection.is_open:
+            self.connection.close()
+        print(" [*] Consumer stopped.")
+
 if __name__ == '__main__':
-    consume_messages()
+    if VALIDATE_AFTER_PARSE:
+        ensure_schema()
+        warm_norms_cache()
+    if CONSUMER_MODE == "threads":
+        ConcurrentConsumer().run()
+    else:
+        consume_messages()
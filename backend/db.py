@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import mysql.connector
+from mysql.connector import pooling
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+    "port": int(os.getenv("DB_PORT", 3306))
+}
+
+DB_POOL_NAME = os.getenv("DB_POOL_NAME", "blackforest")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))           # mysql-connector caps this at 32
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))   # seconds to wait for a free connection
+DB_PING_ATTEMPTS = int(os.getenv("DB_PING_ATTEMPTS", 2))
+
+# === Pool ===
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # The pool is created lazily and per process, so forked workers never share sockets.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=f"{DB_POOL_NAME}-{os.getpid()}",
+                    pool_size=DB_POOL_SIZE,
+                    pool_reset_session=True,
+                    **DB_CONFIG
+                )
+                _pool_pid = os.getpid()
+                logging.info(f"✅ DB pool '{DB_POOL_NAME}' ready with {DB_POOL_SIZE} connections.")
+    return _pool
+
+
+# Checks a connection out of the pool; close() hands it back.
+def get_db_connection():
+    deadline = time.monotonic() + DB_POOL_TIMEOUT
+    while True:
+        try:
+            conn = get_pool().get_connection()
+            break
+        except mysql.connector.errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+    # Health check: the server may have dropped an idle pooled connection (wait_timeout).
+    try:
+        conn.ping(reconnect=True, attempts=DB_PING_ATTEMPTS, delay=0)
+    except mysql.connector.Error:
+        conn.close()
+        raise
+    return conn
+
+
+@contextmanager
+def db_connection():
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def db_cursor(dictionary=False, commit=False):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=dictionary)
+    try:
+        yield cursor
+        if commit:
+            conn.commit()
+    except Exception:
+        if commit:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,254 @@
+import os
+import re
+import difflib
+import hashlib
+import threading
+from collections import Counter, OrderedDict, defaultdict, deque
+from dotenv import load_dotenv
+from db import db_cursor
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+GRADE_SHORTLIST_SIZE = int(os.getenv("GRADE_SHORTLIST_SIZE", 15))
+GRADE_FUZZY_CUTOFF = float(os.getenv("GRADE_FUZZY_CUTOFF", 0.85))
+GRADE_FALLBACK_SIZE = int(os.getenv("GRADE_FALLBACK_SIZE", 40))
+GRADE_FUZZY_MAX_TOKENS = 4  # "42 CrMo 4", "S355 J2 + N": names split over up to four text tokens
+GRADE_FUZZY_MAX_WINDOWS = int(os.getenv("GRADE_FUZZY_MAX_WINDOWS", 2000))
+GRADE_FUZZY_PREFILTER = 25  # names per window that reach difflib, by shared trigrams
+GRADE_FUZZY_FLOOR = 0.5  # lowest cutoff any caller uses; scores below it are not kept
+GRADE_FUZZY_CACHE_SIZE = 64
+
+# === Normalization ===
+# Upper-case, keep letters/digits plus the "+" and "." that are part of grade names
+# (S355J2+N, 1.0577), and collapse every other separator to a single space.
+_SEPARATORS = re.compile(r"[^0-9A-Z+.]+")
+_JOINERS = re.compile(r" ?([+.]) ?")
+
+def normalize_grade(name):
+    text = _SEPARATORS.sub(" ", str(name).upper())
+    return _JOINERS.sub(r"\1", text).strip()
+
+def compact(key):
+    return key.replace(" ", "")
+
+def trigrams(key):
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# === Multi-Pattern Matcher ===
+class AhoCorasick:
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        # Yields (start, end) spans (end exclusive) with the matched pattern.
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern in self._out[node]:
+                yield i + 1 - len(pattern), i + 1, pattern
+
+# === Grade Index ===
+class GradeIndex:
+    def __init__(self, materials):
+        # materials: iterable of (grade_id, grade_name); the first id wins for duplicate names.
+        self.grades = {}
+        for grade_id, grade_name in materials:
+            if not grade_name:
+                continue
+            key = normalize_grade(grade_name)
+            if key and key not in self.grades:
+                self.grades[key] = (grade_id, grade_name)
+        self._compact = {}
+        for key in self.grades:
+            self._compact.setdefault(compact(key), key)
+        self._max_len = max((len(key) for key in self._compact), default=0)
+        self._matcher = AhoCorasick(self.grades)
+
+        # Trigram postings over the compact names: difflib only sees names sharing trigrams
+        # with a window. Scores are memoized per window and per text, since the same text (or a
+        # text grown by one page) is shortlisted several times per certificate.
+        self._trigram_index = defaultdict(list)
+        for name in self._compact:
+            for gram in trigrams(name):
+                self._trigram_index[gram].append(name)
+        self._window_scores = {}
+        self._text_scores = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.grades)
+
+    def find_candidates(self, text):
+        # Exact hits of normalized grade names in the text, most frequent first.
+        norm = normalize_grade(text)
+        spans = []
+        for start, end, key in self._matcher.iter_matches(norm):
+            if start > 0 and norm[start - 1].isalnum():
+                continue
+            if end < len(norm) and norm[end].isalnum():
+                continue
+            spans.append((start, end, key))
+
+        # Drop hits nested in a longer hit, e.g. "S355J2" inside "S355J2+N".
+        spans.sort(key=lambda s: (s[0], -s[1]))
+        counts = Counter()
+        max_end = -1
+        for start, end, key in spans:
+            if end <= max_end:
+                continue
+            max_end = end
+            counts[key] += 1
+        return [self.grades[key] for key, _ in counts.most_common()]
+
+    def _windows(self, text):
+        # Distinct windows of up to GRADE_FUZZY_MAX_TOKENS text tokens, joined without spaces and
+        # containing a digit, in text order and at most GRADE_FUZZY_MAX_WINDOWS of them.
+        words = normalize_grade(text).split()
+        windows = {}
+        for i in range(len(words)):
+            for size in range(1, min(GRADE_FUZZY_MAX_TOKENS, len(words) - i) + 1):
+                window = "".join(words[i:i + size])
+                if len(window) > self._max_len + 2:
+                    break
+                if len(window) >= 3 and any(c.isdigit() for c in window):
+                    windows[window] = None
+            if len(windows) >= GRADE_FUZZY_MAX_WINDOWS:
+                break
+        return windows
+
+    def _score_window(self, window):
+        # [(compact name, ratio)] with ratio >= GRADE_FUZZY_FLOOR.
+        if window in self._compact:
+            return [(window, 1.0)]
+        shared = Counter()
+        for gram in trigrams(window):
+            shared.update(self._trigram_index.get(gram, ()))
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(window)
+        scores = []
+        for name, _ in shared.most_common(GRADE_FUZZY_PREFILTER):
+            matcher.set_seq1(name)
+            if (matcher.real_quick_ratio() >= GRADE_FUZZY_FLOOR and matcher.quick_ratio() >= GRADE_FUZZY_FLOOR
+                    and matcher.ratio() >= GRADE_FUZZY_FLOOR):
+                scores.append((name, matcher.ratio()))
+        return scores
+
+    def _fuzzy_scores(self, text):
+        # {grade key: best ratio over all windows of the text}
+        digest = hashlib.blake2b(text.encode("utf-8", "replace"), digest_size=16).digest()
+        with self._cache_lock:
+            if digest in self._text_scores:
+                self._text_scores.move_to_end(digest)
+                return self._text_scores[digest]
+
+        scores = {}
+        for window in self._windows(text):
+            window_scores = self._window_scores.get(window)
+            if window_scores is None:
+                window_scores = self._score_window(window)
+                with self._cache_lock:
+                    if len(self._window_scores) >= 100 * GRADE_FUZZY_MAX_WINDOWS:
+                        self._window_scores.clear()
+                    self._window_scores[window] = window_scores
+            for name, ratio in window_scores:
+                key = self._compact[name]
+                scores[key] = max(scores.get(key, 0), ratio)
+
+        with self._cache_lock:
+            self._text_scores[digest] = scores
+            while len(self._text_scores) > GRADE_FUZZY_CACHE_SIZE:
+                self._text_scores.popitem(last=False)
+        return scores
+
+    def fuzzy_candidates(self, text, limit=GRADE_SHORTLIST_SIZE, cutoff=0.75):
+        # Catalogue names close to a window of the text, best first.
+        scores = self._fuzzy_scores(text)
+        ranked = sorted((key for key in scores if scores[key] >= cutoff), key=scores.get, reverse=True)[:limit]
+        return [self.grades[key] for key in ranked]
+
+    def shortlist(self, text, limit=GRADE_SHORTLIST_SIZE):
+        # Returns (candidates, unambiguous); unambiguous means exactly one grade is named in the text.
+        exact = self.find_candidates(text)
+        if exact:
+            return exact[:limit], len(exact) == 1
+        return self.fuzzy_candidates(text, limit), False
+
+    def fallback_candidates(self, text, limit=GRADE_FALLBACK_SIZE):
+        # For texts the shortlist finds nothing in: a looser fuzzy pass over the whole catalogue,
+        # or the whole catalogue when it is small enough to prompt with.
+        loose = self.fuzzy_candidates(text, limit, cutoff=0.5)
+        if loose:
+            return loose
+        return list(self.grades.values()) if len(self.grades) <= limit else []
+
+    def resolve(self, answer):
+        # Maps a free-text answer (e.g. an LLM reply) to (grade_id, grade_name).
+        if not answer:
+            return None, None
+        key = normalize_grade(answer)
+        if key in self.grades:
+            return self.grades[key]
+        if compact(key) in self._compact:
+            return self.grades[self._compact[compact(key)]]
+
+        close = difflib.get_close_matches(compact(key), list(self._compact), n=1, cutoff=GRADE_FUZZY_CUTOFF)
+        if close:
+            return self.grades[self._compact[close[0]]]
+
+        hits = self.find_candidates(answer)
+        if len(hits) == 1:
+            return hits[0]
+        return None, None
+
+# === Shared Instance ===
+_index = None
+_index_lock = threading.Lock()
+
+def load_grade_index():
+    with db_cursor() as cursor:
+        cursor.execute("SELECT id, grade_name FROM materials ORDER BY id")
+        rows = cursor.fetchall()
+    return GradeIndex(rows)
+
+def get_grade_index(refresh=False):
+    global _index
+    if _index is None or refresh:
+        with _index_lock:
+            if _index is None or refresh:
+                _index = load_grade_index()
+    return _index
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from dotenv import load_dotenv
+from local_store import SQLiteStore
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+
+def cache_key(model, system_message, prompt, response_format=None):
+    payload = json.dumps([model, system_message, prompt, response_format], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# === Cache ===
+class ResponseCache(SQLiteStore):
+    # Completed LLM answers keyed by sha256(model, system message, prompt, response format).
+    # Entries expire after the TTL; past the size budget the least recently used go first.
+    def __init__(self, path=LLM_CACHE_DB, max_bytes=LLM_CACHE_MAX_BYTES, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses (last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            conn.executemany("INSERT OR IGNORE INTO llm_cache_stats (name, value) VALUES (?, 0)",
+                             [("hits",), ("misses",), ("evictions",), ("bytes",)])
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute("UPDATE llm_cache_stats SET value = value + ? WHERE name = ?", (amount, name))
+
+    def get(self, key):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT response, size, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row["created_at"] < now - self.ttl_seconds:
+                conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                self._bump(conn, "bytes", -row["size"])
+                row = None
+            if row is None:
+                self._bump(conn, "misses")
+                return None
+            conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+            self._bump(conn, "hits")
+            return row["response"]
+
+    def put(self, key, model, response):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._transaction() as conn:
+            old = conn.execute("SELECT size FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            conn.execute("""
+                INSERT OR REPLACE INTO llm_responses (key, model, response, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, model, response, size, now, now))
+            self._bump(conn, "bytes", size - (old["size"] if old else 0))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT value FROM llm_cache_stats WHERE name = 'bytes'").fetchone()["value"]
+        if total <= self.max_bytes:
+            return
+        victims, freed = [], 0
+        for row in conn.execute("SELECT key, size FROM llm_responses ORDER BY last_access"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((row["key"],))
+            freed += row["size"]
+        conn.executemany("DELETE FROM llm_responses WHERE key = ?", victims)
+        self._bump(conn, "bytes", -freed)
+        self._bump(conn, "evictions", len(victims))
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._transaction() as conn:
+            freed = conn.execute("SELECT COALESCE(SUM(size), 0) AS s FROM llm_responses WHERE created_at < ?", (cutoff,)).fetchone()["s"]
+            removed = conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (cutoff,)).rowcount
+            self._bump(conn, "bytes", -freed)
+        return removed
+
+    def stats(self):
+        with self._transaction() as conn:
+            stats = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM llm_cache_stats")}
+            stats["entries"] = conn.execute("SELECT COUNT(*) AS n FROM llm_responses").fetchone()["n"]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM llm_responses")
+            conn.execute("UPDATE llm_cache_stats SET value = 0")
+
+# === Shared Instance ===
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
+
+# === CLI ===
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="LLM response cache maintenance")
+    cli.add_argument("command", choices=["stats", "purge-expired", "clear"])
+    args = cli.parse_args()
+
+    cache = ResponseCache()
+    if args.command == "stats":
+        print("📊", cache.stats())
+    elif args.command == "purge-expired":
+        print(f"🧹 Removed {cache.purge_expired()} expired entries.")
+    elif args.command == "clear":
+        cache.clear()
+        logging.info("🧹 LLM response cache cleared")
+        print("🧹 Cache cleared.")
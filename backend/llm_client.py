@@ -0,0 +1,134 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from llm_scheduler import get_scheduler, estimate_tokens
+from llm_cache import get_response_cache, cache_key
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-1.5-flash")
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 120))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 1.0))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 30))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 16))
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+class LLMUnavailable(Exception):
+    # OpenRouter unreachable or still answering with a retryable status after every retry;
+    # the whole job is worth retrying later (see consumer.py).
+    pass
+
+# === Client ===
+class OpenRouterClient:
+    # Keep-alive session (one TLS handshake per pooled connection, not per call), explicit
+    # connect/read timeouts and full-jitter exponential backoff on transient failures.
+    def __init__(self, api_key=OPENROUTER_API_KEY, model=OPENROUTER_MODEL, pool_size=LLM_POOL_SIZE,
+                 max_retries=LLM_MAX_RETRIES, timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)):
+        self.model = model
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX)
+            except ValueError:
+                pass  # HTTP-date form; fall back to our own schedule
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+    def complete(self, prompt, system_message, model=None, response_format=None, use_cache=True):
+        body = {
+            "model": model or self.model,
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        if response_format:
+            body["response_format"] = response_format
+
+        # Identical (model, system, prompt, format) requests are answered from disk; see llm_cache.py
+        cache = get_response_cache() if use_cache else None
+        key = cache_key(body["model"], system_message, prompt, response_format) if cache else None
+        if cache:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        # The shared scheduler spaces requests across workers; see llm_scheduler.py
+        scheduler = get_scheduler()
+        estimated = estimate_tokens(system_message, prompt)
+
+        for attempt in range(self.max_retries + 1):
+            if scheduler:
+                scheduler.acquire(body["model"], estimated)
+            try:
+                response = self.session.post(OPENROUTER_URL, json=body, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise LLMUnavailable(f"OpenRouter request failed: {e}") from e
+                delay = self._backoff(attempt)
+                logging.warning(f"⚠️ OpenRouter request failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            payload = response.json() if response.ok else None
+            if scheduler:
+                used = (payload or {}).get("usage", {}).get("total_tokens")
+                scheduler.observe(body["model"], response.status_code, response.headers, estimated, used)
+
+            if response.status_code in RETRYABLE_STATUSES and attempt < self.max_retries:
+                if scheduler and response.status_code == 429:
+                    # The scheduler already paused the shared budget; acquire() waits it out.
+                    logging.warning("⚠️ OpenRouter returned 429, waiting for the shared rate budget")
+                    continue
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                logging.warning(f"⚠️ OpenRouter returned {response.status_code}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in RETRYABLE_STATUSES:
+                raise LLMUnavailable(f"OpenRouter returned {response.status_code} after {attempt + 1} attempts")
+            response.raise_for_status()
+            content = payload["choices"][0]["message"]["content"].strip()
+            if cache:
+                cache.put(key, body["model"], content)
+            return content
+
+    async def acomplete(self, prompt, system_message, model=None, response_format=None, use_cache=True):
+        # Runs the pooled sync call in a worker thread so asyncio callers can fan out requests.
+        return await asyncio.to_thread(self.complete, prompt, system_message, model, response_format, use_cache)
+
+# === Shared Instance ===
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_llm_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = OpenRouterClient()
+                _client_pid = os.getpid()
+    return _client
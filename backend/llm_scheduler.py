@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from local_store import SQLiteStore
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_RATE_DB = os.getenv("LLM_RATE_DB", "llm_rate.db")
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 200000))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 60))
+LLM_CHARS_PER_TOKEN = float(os.getenv("LLM_CHARS_PER_TOKEN", 4))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", 512))
+LLM_SCHEDULER_MAX_WAIT = float(os.getenv("LLM_SCHEDULER_MAX_WAIT", 300))
+
+RATE_SAFETY = 0.9        # run slightly under a provider-announced limit
+BACKOFF_FACTOR = 0.8     # multiplicative decrease on 429
+RECOVERY_STEP = 0.02     # additive increase (fraction of the ceiling) per successful call
+MIN_CAPACITY_SHARE = 0.1
+
+# === Token Estimation ===
+def estimate_tokens(*texts):
+    # Cheap provider-independent estimate; actual usage is reconciled after the response.
+    chars = sum(len(t) for t in texts if t)
+    return int(chars / LLM_CHARS_PER_TOKEN) + 8 * len(texts) + LLM_EXPECTED_COMPLETION_TOKENS
+
+# === Rate-Limit Headers ===
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _parse_reset(value, now):
+    # Accepts epoch milliseconds/seconds (OpenRouter) or durations like "6m0s" / "250ms" (OpenAI style).
+    if value is None:
+        return None
+    number = _parse_float(value)
+    if number is not None:
+        if number > 1e11:
+            return number / 1000.0
+        if number > 1e9:
+            return number
+        return now + number
+    seconds = 0.0
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for amount, unit in _DURATION_PART.findall(value):
+        seconds += float(amount) * units[unit]
+    return now + seconds if seconds else None
+
+def parse_rate_limit_headers(headers, now=None):
+    now = now or time.time()
+    get = lambda *names: next((headers.get(n) for n in names if headers.get(n) is not None), None)
+    return {
+        "request_limit": _parse_float(get("x-ratelimit-limit-requests", "x-ratelimit-limit")),
+        "request_remaining": _parse_float(get("x-ratelimit-remaining-requests", "x-ratelimit-remaining")),
+        "request_reset": _parse_reset(get("x-ratelimit-reset-requests", "x-ratelimit-reset"), now),
+        "token_limit": _parse_float(get("x-ratelimit-limit-tokens")),
+        "token_remaining": _parse_float(get("x-ratelimit-remaining-tokens")),
+        "token_reset": _parse_reset(get("x-ratelimit-reset-tokens"), now),
+        "retry_after": _parse_float(get("retry-after"))
+    }
+
+# === Scheduler ===
+class RateScheduler(SQLiteStore):
+    # Per-model token buckets (tokens and requests, refilled per minute) kept in a SQLite file.
+    # BEGIN IMMEDIATE takes SQLite's write lock, so every worker process on the host draws from
+    # the same budget. Capacity adapts: AIMD on 429s, capped by limits announced in headers.
+    def __init__(self, path=LLM_RATE_DB, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 requests_per_minute=LLM_REQUESTS_PER_MINUTE):
+        super().__init__(path)
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_buckets (
+                    model TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    requests REAL NOT NULL,
+                    token_capacity REAL NOT NULL,
+                    request_capacity REAL NOT NULL,
+                    token_ceiling REAL NOT NULL,
+                    request_ceiling REAL NOT NULL,
+                    blocked_until REAL NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _load(self, conn, model, now):
+        row = conn.execute("SELECT * FROM llm_buckets WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            conn.execute("""
+                INSERT INTO llm_buckets (model, tokens, requests, token_capacity, request_capacity,
+                                         token_ceiling, request_ceiling, blocked_until, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)
+            """, (model, self.tokens_per_minute, self.requests_per_minute, self.tokens_per_minute,
+                  self.requests_per_minute, self.tokens_per_minute, self.requests_per_minute, now))
+            row = conn.execute("SELECT * FROM llm_buckets WHERE model = ?", (model,)).fetchone()
+
+        bucket = dict(row)
+        elapsed = max(0.0, now - bucket["updated_at"])
+        bucket["tokens"] = min(bucket["token_capacity"], bucket["tokens"] + elapsed * bucket["token_capacity"] / 60)
+        bucket["requests"] = min(bucket["request_capacity"], bucket["requests"] + elapsed * bucket["request_capacity"] / 60)
+        bucket["updated_at"] = now
+        return bucket
+
+    def _save(self, conn, bucket):
+        conn.execute("""
+            UPDATE llm_buckets
+            SET tokens = ?, requests = ?, token_capacity = ?, request_capacity = ?,
+                token_ceiling = ?, request_ceiling = ?, blocked_until = ?, updated_at = ?
+            WHERE model = ?
+        """, (bucket["tokens"], bucket["requests"], bucket["token_capacity"], bucket["request_capacity"],
+              bucket["token_ceiling"], bucket["request_ceiling"], bucket["blocked_until"],
+              bucket["updated_at"], bucket["model"]))
+
+    def _try_acquire(self, model, tokens):
+        # Returns 0 when the budget was taken, otherwise the seconds to wait before retrying.
+        now = time.time()
+        with self._transaction() as conn:
+            bucket = self._load(conn, model, now)
+            needed = min(tokens, bucket["token_capacity"])
+            if now < bucket["blocked_until"]:
+                wait = bucket["blocked_until"] - now
+            elif bucket["tokens"] >= needed and bucket["requests"] >= 1:
+                bucket["tokens"] -= tokens
+                bucket["requests"] -= 1
+                wait = 0
+            else:
+                token_wait = max(0.0, needed - bucket["tokens"]) * 60 / bucket["token_capacity"]
+                request_wait = max(0.0, 1 - bucket["requests"]) * 60 / bucket["request_capacity"]
+                wait = max(token_wait, request_wait, 0.05)
+            self._save(conn, bucket)
+        return wait
+
+    def acquire(self, model, tokens):
+        deadline = time.monotonic() + LLM_SCHEDULER_MAX_WAIT
+        while True:
+            wait = self._try_acquire(model, tokens)
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise TimeoutError(f"LLM rate budget for {model} not available within {LLM_SCHEDULER_MAX_WAIT}s")
+            time.sleep(wait)
+
+    def observe(self, model, status_code, headers, estimated_tokens, used_tokens=None):
+        now = time.time()
+        limits = parse_rate_limit_headers(headers or {}, now)
+        with self._transaction() as conn:
+            bucket = self._load(conn, model, now)
+
+            # Provider-announced limits become the ceiling; remaining counts cap the local bucket.
+            if limits["token_limit"]:
+                bucket["token_ceiling"] = limits["token_limit"] * RATE_SAFETY
+            if limits["request_limit"]:
+                bucket["request_ceiling"] = limits["request_limit"] * RATE_SAFETY
+            if limits["token_remaining"] is not None:
+                bucket["tokens"] = min(bucket["tokens"], limits["token_remaining"])
+            if limits["request_remaining"] is not None:
+                bucket["requests"] = min(bucket["requests"], limits["request_remaining"])
+                if limits["request_remaining"] <= 0 and limits["request_reset"]:
+                    bucket["blocked_until"] = max(bucket["blocked_until"], limits["request_reset"])
+            if limits["token_remaining"] is not None and limits["token_remaining"] <= 0 and limits["token_reset"]:
+                bucket["blocked_until"] = max(bucket["blocked_until"], limits["token_reset"])
+
+            if status_code == 429:
+                bucket["token_capacity"] = max(bucket["token_ceiling"] * MIN_CAPACITY_SHARE, bucket["token_capacity"] * BACKOFF_FACTOR)
+                bucket["request_capacity"] = max(bucket["request_ceiling"] * MIN_CAPACITY_SHARE, bucket["request_capacity"] * BACKOFF_FACTOR)
+                bucket["tokens"] = min(bucket["tokens"], 0.0)
+                pause = limits["retry_after"] or 60 / bucket["request_capacity"]
+                bucket["blocked_until"] = max(bucket["blocked_until"], now + pause)
+                logging.warning(f"🚦 429 for {model}: capacity now {bucket['token_capacity']:.0f} tok/min, "
+                                f"{bucket['request_capacity']:.1f} req/min")
+            elif status_code < 400:
+                bucket["token_capacity"] = bucket["token_capacity"] + bucket["token_ceiling"] * RECOVERY_STEP
+                bucket["request_capacity"] = bucket["request_capacity"] + bucket["request_ceiling"] * RECOVERY_STEP
+                if used_tokens is not None:
+                    bucket["tokens"] -= used_tokens - estimated_tokens
+
+            bucket["token_capacity"] = min(bucket["token_capacity"], bucket["token_ceiling"])
+            bucket["request_capacity"] = min(bucket["request_capacity"], bucket["request_ceiling"])
+            self._save(conn, bucket)
+
+# === Shared Instance ===
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    if not LLM_SCHEDULER_ENABLED:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RateScheduler()
+    return _scheduler
@@ -0,0 +1,33 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# === SQLite-backed local store ===
+# Shared by the LLM rate scheduler and the LLM response cache: one connection per thread
+# (and per process after a fork), WAL mode, and BEGIN IMMEDIATE transactions so several
+# worker processes on the same host can safely share one file.
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
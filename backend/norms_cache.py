@@ -0,0 +1,315 @@
+import os
+import re
+import math
+import time
+import bisect
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from db import db_cursor
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+NORMS_CACHE_ENABLED = os.getenv("NORMS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+NORMS_CACHE_WARM = os.getenv("NORMS_CACHE_WARM", "false").lower() in ("1", "true", "yes")
+NORMS_VERSION_CHECK_SECONDS = float(os.getenv("NORMS_VERSION_CHECK_SECONDS", 5))
+
+# In-process cache of the chemical/mechanical limits per grade, with mechanical diameter bands
+# pre-parsed into a sorted interval index per property. Every write to the limit tables bumps
+# the single row in norms_version; each process compares its cached version (at most every
+# NORMS_VERSION_CHECK_SECONDS) and drops everything when another process has changed the norms.
+
+# === Diameter Bands ===
+# Free text from /prop_update: ">16 ≤ 40", "16-40", "≥3, ≤100", "≤ 16 mm", "16 < d ≤ 40", "16,5-40".
+# Always (lower, upper) with None for an open side; text that is not a band is unbanded.
+_BAND_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_BAND_RANGE = re.compile(rf"^{_BAND_NUMBER}\s*-\s*{_BAND_NUMBER}$")
+_BAND_BETWEEN = re.compile(rf"^{_BAND_NUMBER}\s*[<≤]\s*[<≤]\s*{_BAND_NUMBER}$")
+_BAND_BOUND = re.compile(rf"([<>≤≥])?\s*{_BAND_NUMBER}")
+_BAND_SEPARATOR = re.compile(r"^[\s,;/]*$")
+
+def _band_number(text):
+    return float(text.replace(",", "."))
+
+def _parse_band(text):
+    text = text.replace("<=", "≤").replace(">=", "≥").replace("–", "-").replace("—", "-")
+    text = re.sub(r"[^\d.,<>≤≥\s-]", "", text).strip(" \t\r\n,")
+    if not text or text == "-":
+        return (None, None)
+    for pattern in (_BAND_RANGE, _BAND_BETWEEN):
+        match = pattern.match(text)
+        if match:
+            return (_band_number(match.group(1)), _band_number(match.group(2)))
+
+    lower = upper = None
+    end = 0
+    for match in _BAND_BOUND.finditer(text):
+        if not match.group(1) or not _BAND_SEPARATOR.match(text[end:match.start()]):
+            return None
+        end = match.end()
+        value = _band_number(match.group(2))
+        if match.group(1) in "<≤":
+            if upper is not None:
+                return None
+            upper = value
+        else:
+            if lower is not None:
+                return None
+            lower = value
+    if end != len(text) or (lower is None and upper is None):
+        return None
+    return (lower, upper)
+
+def parse_diameter_range(diameter_text):
+    if diameter_text is None or pd.isna(diameter_text):
+        return (None, None)
+    band = _parse_band(str(diameter_text))
+    if band is None or (None not in band and band[0] >= band[1]):
+        logging.warning(f"⚠️ Diameter band {diameter_text!r} not understood, treating the row as unbanded")
+        return (None, None)
+    return band
+
+class DiameterBands:
+    # Bands (lower, upper] of one property sorted by upper bound; lookup is a bisect.
+    __slots__ = ("uppers", "lowers", "rows", "fallback")
+
+    def __init__(self, bands, fallback):
+        bands.sort()
+        self.uppers = [upper for upper, _, _ in bands]
+        self.lowers = [lower for _, lower, _ in bands]
+        self.rows = [row for _, _, row in bands]
+        self.fallback = fallback
+
+    def find(self, diameter):
+        i = bisect.bisect_left(self.uppers, diameter)
+        if i < len(self.uppers) and self.lowers[i] < diameter:
+            return self.rows[i]
+        return self.fallback
+
+# === Limits ===
+class PropertyLimits:
+    # Limit rows of one grade and kind, in table order, as parallel arrays plus a name index.
+    __slots__ = ("ids", "names", "min_values", "max_values", "units", "diameters", "_by_name", "_bands")
+
+    def __init__(self, rows):
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.names = tuple(row[1] for row in rows)
+        self.min_values = pd.to_numeric(pd.Series([row[2] for row in rows], dtype=object), errors="coerce").to_numpy(dtype=float)
+        self.max_values = pd.to_numeric(pd.Series([row[3] for row in rows], dtype=object), errors="coerce").to_numpy(dtype=float)
+        self.units = tuple(row[4] for row in rows) if rows and len(rows[0]) > 4 else ()
+        self.diameters = tuple(row[5] for row in rows) if rows and len(rows[0]) > 5 else ()
+
+        self._by_name = {}
+        for i, name in enumerate(self.names):
+            self._by_name.setdefault(name, []).append(i)
+        self._bands = {}
+        for name, positions in self._by_name.items():
+            bands, unbanded = [], None
+            for i in positions:
+                lower, upper = parse_diameter_range(self.diameters[i]) if self.diameters else (None, None)
+                if lower is None and upper is None:
+                    unbanded = i if unbanded is None else unbanded
+                    continue
+                bands.append((math.inf if upper is None else upper, -math.inf if lower is None else lower, i))
+            if bands:
+                # Diameters outside every band use an unbanded row, else the first row as before.
+                self._bands[name] = DiameterBands(bands, positions[0] if unbanded is None else unbanded)
+
+    def __len__(self):
+        return len(self.names)
+
+    def distinct_names(self):
+        return list(dict.fromkeys(name for name in self.names if name))
+
+    def select(self, name, diameter=None):
+        # Row position of the limit that applies to `name`, or None when the grade does not define it.
+        positions = self._by_name.get(name)
+        if not positions:
+            return None
+        bands = self._bands.get(name)
+        if bands is None or diameter is None:
+            return positions[0]
+        return bands.find(diameter)
+
+
+class GradeNorms:
+    __slots__ = ("grade_id", "chemical", "mechanical")
+
+    def __init__(self, grade_id, chemical_rows, mechanical_rows):
+        self.grade_id = grade_id
+        self.chemical = PropertyLimits(chemical_rows)
+        self.mechanical = PropertyLimits(mechanical_rows)
+
+    def limits(self, kind):
+        return self.chemical if kind == "chemical" else self.mechanical
+
+# === Version Counter ===
+def read_norms_version(cursor):
+    cursor.execute("SELECT version FROM norms_version WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def bump_norms_version(cursor):
+    # Run inside the transaction that changes the limits, so readers never see new norms with an old version.
+    cursor.execute("UPDATE norms_version SET version = version + 1 WHERE id = 1")
+
+# === Cache ===
+class NormsCache:
+    def __init__(self, check_interval=NORMS_VERSION_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._grades = {}
+        self._version = None
+        # Bumped on every clear; a load only stores its result if no clear happened meanwhile.
+        self._generation = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with db_cursor() as cursor:
+            version = read_norms_version(cursor)
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                if self._version is not None:
+                    logging.info(f"🔄 Norms changed (version {self._version} -> {version}), clearing cache")
+                self._grades.clear()
+                self._generation += 1
+                self._version = version
+
+    def _load(self, grade_ids):
+        placeholders = ", ".join(["%s"] * len(grade_ids))
+        with db_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT grade_id, id, element, min_value, max_value
+                FROM chemical_properties
+                WHERE grade_id IN ({placeholders})
+                ORDER BY id
+            """, grade_ids)
+            chemical = cursor.fetchall()
+            cursor.execute(f"""
+                SELECT grade_id, id, property_name, min_value, max_value, unit, diameter
+                FROM mechanical_properties
+                WHERE grade_id IN ({placeholders})
+                ORDER BY id
+            """, grade_ids)
+            mechanical = cursor.fetchall()
+
+        chem_rows = {grade_id: [] for grade_id in grade_ids}
+        mech_rows = {grade_id: [] for grade_id in grade_ids}
+        for grade_id, *row in chemical:
+            chem_rows[grade_id].append(row)
+        for grade_id, *row in mechanical:
+            mech_rows[grade_id].append(row)
+        return {grade_id: GradeNorms(grade_id, chem_rows[grade_id], mech_rows[grade_id]) for grade_id in grade_ids}
+
+    def version(self):
+        self._check_version()
+        return self._version
+
+    def get_many(self, grade_ids):
+        self._check_version()
+        grade_ids = list(dict.fromkeys(g for g in grade_ids if g is not None))
+        with self._lock:
+            found = {g: self._grades[g] for g in grade_ids if g in self._grades}
+            generation = self._generation
+        missing = [g for g in grade_ids if g not in found]
+        if missing:
+            loaded = self._load(missing)
+            with self._lock:
+                # A load that started before an invalidate or version bump may hold old limits:
+                # it answers this call but is not cached under the new state.
+                if self._generation == generation:
+                    self._grades.update(loaded)
+            found.update(loaded)
+        return found
+
+    def get(self, grade_id):
+        return self.get_many([grade_id]).get(grade_id)
+
+    def warm(self):
+        with db_cursor() as cursor:
+            cursor.execute("SELECT id FROM materials")
+            grade_ids = [row[0] for row in cursor.fetchall()]
+        if grade_ids:
+            self.get_many(grade_ids)
+        logging.info(f"🔥 Norms cache warmed with {len(grade_ids)} grades")
+
+    def invalidate(self, grade_id=None):
+        with self._lock:
+            if grade_id is None:
+                self._grades.clear()
+            else:
+                self._grades.pop(grade_id, None)
+            self._generation += 1
+            self._checked_at = 0.0
+
+    def property_names(self, kind, grade_id):
+        norms = self.get(grade_id)
+        return norms.limits(kind).distinct_names() if norms else []
+
+# === Serialized Responses ===
+class NormsResponseCache:
+    # Rendered responses that depend only on the norms (e.g. /category/<id>), stored with
+    # the norms version they were built from and a content hash used as the ETag.
+    def __init__(self, norms):
+        self.norms = norms
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        version = self.norms.version()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, key, body, version):
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        with self._lock:
+            self._entries[key] = (version, etag, body)
+        return etag
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+# === Shared Instance ===
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+def get_norms_cache():
+    global _cache, _cache_pid
+    if not NORMS_CACHE_ENABLED:
+        # Every lookup goes to the database: a fresh cache that rechecks on each call.
+        return NormsCache(check_interval=0)
+    if _cache is None or _cache_pid != os.getpid():
+        with _cache_lock:
+            if _cache is None or _cache_pid != os.getpid():
+                _cache = NormsCache()
+                _cache_pid = os.getpid()
+    return _cache
+
+_responses = None
+_responses_lock = threading.Lock()
+
+def get_norms_response_cache():
+    global _responses
+    if _responses is None or _responses.norms is not get_norms_cache():
+        with _responses_lock:
+            if _responses is None or _responses.norms is not get_norms_cache():
+                _responses = NormsResponseCache(get_norms_cache())
+    return _responses
+
+def warm_norms_cache():
+    if NORMS_CACHE_ENABLED and NORMS_CACHE_WARM:
+        get_norms_cache().warm()
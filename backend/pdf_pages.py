@@ -0,0 +1,70 @@
+import os
+import re
+import logging
+from io import BytesIO
+from dotenv import load_dotenv
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+LOCAL_TEXT_LAYER_ENABLED = os.getenv("LOCAL_TEXT_LAYER_ENABLED", "true").lower() in ("1", "true", "yes")
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", 40))
+
+# Digitally generated certificates carry an embedded text layer that reads locally in milliseconds.
+# Pages are checked one by one; only pages without usable text (scans, images) go to LlamaParse.
+SOURCE_TEXT_LAYER = "text_layer"
+SOURCE_LLAMAPARSE = "llamaparse"
+
+_ALNUM = re.compile(r"[0-9A-Za-zÀ-ÿ]")
+_GARBLED = re.compile(r"\(cid:\d+\)|�")
+
+# === Text Layer ===
+def open_pdf(stream):
+    try:
+        reader = PdfReader(stream)
+        len(reader.pages)  # parsing is lazy; surface broken page trees here
+        return reader
+    except (PdfReadError, ValueError, KeyError, OSError) as e:
+        logging.warning(f"⚠️ pypdf could not read PDF: {e}")
+        return None
+
+def page_text(page):
+    # Layout mode keeps table columns aligned with spaces, like LlamaParse's text output.
+    try:
+        text = page.extract_text(extraction_mode="layout")
+    except Exception:
+        try:
+            text = page.extract_text()
+        except Exception:
+            return ""
+    return "\n".join(line.rstrip() for line in (text or "").splitlines()).strip("\n")
+
+def has_text_layer(text):
+    # Enough real characters, and not fonts without a unicode map that come out as (cid:NN).
+    chars = len(_ALNUM.findall(text))
+    return chars >= TEXT_LAYER_MIN_CHARS and len(_GARBLED.findall(text)) * 10 < chars
+
+def read_text_layer(reader):
+    # -> [text or None per page]; None marks a page that needs the remote parser.
+    texts = []
+    for page in reader.pages:
+        text = page_text(page)
+        texts.append(text if has_text_layer(text) else None)
+    return texts
+
+def subset_pdf(reader, page_numbers):
+    # A new in-memory PDF holding only the given 1-based pages, in order.
+    writer = PdfWriter()
+    for page_no in page_numbers:
+        writer.add_page(reader.pages[page_no - 1])
+    out = BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
+
+def merge_pages(pages):
+    # pages: [(page_no, source, text)] -> document text in page order.
+    return "\n".join(text for _, _, text in sorted(pages, key=lambda page: page[0]) if text)
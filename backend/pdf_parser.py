@@ -1,9 +1,18 @@
 import os
+import mmap
 import mysql.connector
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from llama_parse import LlamaParse
-from llama_index.core import SimpleDirectoryReader
+import db
+from db import db_cursor
+from grade_index import get_grade_index
+from schema import ensure_schema
+from progress_events import emit_progress, STAGE_GRADE_MATCHED
+from blob_store import get_blob_store
+from pdf_pages import (LOCAL_TEXT_LAYER_ENABLED, SOURCE_TEXT_LAYER, SOURCE_LLAMAPARSE,
+                       open_pdf, read_text_layer, subset_pdf, merge_pages)
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +26,10 @@ logging.basicConfig(
 
 # === ENV Variables ===
 LLAMA_API_KEY = os.getenv("LLAMA_API_KEY")
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PARSE_PARALLEL_MIN_PAGES = int(os.getenv("PARSE_PARALLEL_MIN_PAGES", 10))
+PARSE_PAGES_PER_CHUNK = int(os.getenv("PARSE_PAGES_PER_CHUNK", 5))
+PARSE_MAX_IN_FLIGHT = int(os.getenv("PARSE_MAX_IN_FLIGHT", 4))
 
 # === LlamaParse Setup ===
 parser = LlamaParse(api_key=LLAMA_API_KEY, result_type="text", verbose=True)
@@ -24,85 +37,281 @@ parser = LlamaParse(api_key=LLAMA_API_KEY, result_type="text", verbose=True)
 # === DB Connection ===
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME"),
-            port=int(os.getenv("DB_PORT", 3306))
-        )
-        logging.info("✅ DB connection established.")
-        return conn
+        return db.get_db_connection()
     except mysql.connector.Error as err:
         logging.error(f"❌ DB connection failed: {err}")
         return None
 
-# === Save to DB ===
-def save_texts_to_database(filename, category, ai_extracted_content, pdf_binary):
+class ParseFailed(Exception):
+    # The parse failed as a whole or for some pages. The row keeps what was parsed, and the
+    # job is worth retrying later (see consumer.py).
+    def __init__(self, message, pdf_id=None):
+        super().__init__(message)
+        self.pdf_id = pdf_id
+
+# === Parse Cache ===
+def is_parsed(pdf_id):
+    # The row holds a complete parse: its own text or a link to a cached one.
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM parsed_pdfs
+            WHERE id = %s
+              AND parse_failed_pages IS NULL
+              AND (parsed_from_id IS NOT NULL OR (ai_extracted_data IS NOT NULL AND ai_extracted_data <> ''))
+        """, (pdf_id,))
+        return cursor.fetchone() is not None
+
+def find_parsed_pdf_by_hash(content_hash, exclude_id=None):
+    # Only rows that hold a complete parse can serve as a cache source.
     conn = get_db_connection()
     if not conn:
-        return
+        return None
     try:
         cursor = conn.cursor()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS parsed_pdfs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                filename VARCHAR(255) NOT NULL,
-                category VARCHAR(255),
-                file_data LONGBLOB,
-                ai_extracted_data LONGTEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            )
-        """)
-        cursor.execute("""
-            INSERT INTO parsed_pdfs (filename, category, file_data, ai_extracted_data)
-            VALUES (%s, %s, %s, %s)
-        """, (filename, category, pdf_binary, ai_extracted_content))
+            SELECT id FROM parsed_pdfs
+            WHERE content_hash = %s
+              AND id <> %s
+              AND parsed_from_id IS NULL
+              AND ai_extracted_data IS NOT NULL AND ai_extracted_data <> ''
+              AND parse_failed_pages IS NULL
+            ORDER BY id
+            LIMIT 1
+        """, (content_hash, exclude_id or 0))
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else None
+    except mysql.connector.Error as err:
+        logging.error(f"❌ Parse cache lookup failed: {err}")
+        return None
+    finally:
+        conn.close()
+
+# === Save to DB ===
+def save_texts_to_database(filename, category, ai_extracted_content, content_hash, parsed_from_id=None, pdf_id=None, pages=None,
+                           failed_pages=None):
+    # The PDF itself stays in the blob store; parsed_pdfs keeps only its digest.
+    # failed_pages marks a partial parse: never served from the parse cache, never validated.
+    failed = ",".join(map(str, failed_pages)) if failed_pages else None
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        if pdf_id:
+            # Row created by the /upload endpoint.
+            cursor.execute("""
+                UPDATE parsed_pdfs
+                SET ai_extracted_data = %s, content_hash = %s, parsed_from_id = %s, parse_failed_pages = %s
+                WHERE id = %s
+            """, (ai_extracted_content, content_hash, parsed_from_id, failed, pdf_id))
+        else:
+            cursor.execute("""
+                INSERT INTO parsed_pdfs (filename, category, category_id, ai_extracted_data, content_hash, parsed_from_id,
+                                         parse_failed_pages)
+                VALUES (%s, %s, (SELECT id FROM categories WHERE name = %s), %s, %s, %s, %s)
+            """, (filename, category, category, ai_extracted_content, content_hash, parsed_from_id, failed))
+            pdf_id = cursor.lastrowid
+        if pages is not None:
+            save_pages(cursor, pdf_id, pages)
         conn.commit()
         logging.info(f"💾 Saved to DB: {filename} in category: {category}")
+        return pdf_id
     except mysql.connector.Error as err:
         logging.error(f"❌ DB insert failed: {err}")
+        return None
     finally:
         conn.close()
 
+def save_pages(cursor, pdf_id, pages):
+    # One row per page with the path it took (text_layer / llamaparse); the caller commits.
+    cursor.execute("DELETE FROM parsed_pdf_pages WHERE pdf_id = %s", (pdf_id,))
+    if pages:
+        cursor.executemany("""
+            INSERT INTO parsed_pdf_pages (pdf_id, page_no, source, text)
+            VALUES (%s, %s, %s, %s)
+        """, [(pdf_id, page_no, source, text) for page_no, source, text in pages])
+
+# === Parsing ===
+def parse_with_llamaparse(pdf_stream, filename):
+    if isinstance(pdf_stream, mmap.mmap):
+        pdf_stream = pdf_stream[:]  # LlamaParse takes bytes or a file object, not a mapping
+    documents = parser.load_data(pdf_stream, extra_info={"file_name": filename})
+    return [doc.text for doc in documents]
+
+def parse_remote_chunk(pdf_stream, page_numbers, filename):
+    # LlamaParse on a sub-PDF holding `page_numbers`; -> [(page_no, source, text)].
+    texts = parse_with_llamaparse(pdf_stream, filename)
+    if len(texts) != len(page_numbers):
+        # Page split not returned one-to-one: keep the text together on the first page sent.
+        texts = ["\n".join(texts)] + [""] * (len(page_numbers) - 1)
+    return [(page_no, SOURCE_LLAMAPARSE, text) for page_no, text in zip(page_numbers, texts)]
+
+def parse_remote_pages(reader, page_numbers, filename, on_pages=None):
+    # Large scanned bundles are cut into page ranges parsed concurrently, at most
+    # PARSE_MAX_IN_FLIGHT requests at a time; each range is handed to on_pages as it arrives.
+    # -> (pages, failed page numbers).
+    if len(page_numbers) < PARSE_PARALLEL_MIN_PAGES:
+        chunks = [page_numbers]
+    else:
+        chunks = [page_numbers[i:i + PARSE_PAGES_PER_CHUNK] for i in range(0, len(page_numbers), PARSE_PAGES_PER_CHUNK)]
+
+    pages, failed = [], []
+    # The reader is not thread-safe, so the sub-PDFs are built here before the requests start.
+    with ThreadPoolExecutor(max_workers=min(PARSE_MAX_IN_FLIGHT, len(chunks))) as executor:
+        futures = {executor.submit(parse_remote_chunk, subset_pdf(reader, chunk), chunk, filename): chunk
+                   for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                received = future.result()
+            except Exception as e:
+                logging.error(f"❌ LlamaParse failed for pages {chunk[0]}-{chunk[-1]} of {filename}: {e}")
+                failed += chunk
+                continue
+            pages += received
+            if len(chunks) > 1:
+                print(f"📄 {filename}: pages {chunk[0]}-{chunk[-1]} parsed")
+            if on_pages:
+                on_pages(received)
+    return pages, sorted(failed)
+
+def parse_pages(pdf_stream, filename, on_pages=None):
+    # -> ([(page_no, source, text)] in page order, [page numbers that failed to parse]).
+    # Pages with an embedded text layer are read locally.
+    reader = open_pdf(pdf_stream) if LOCAL_TEXT_LAYER_ENABLED else None
+    if reader is None:
+        pdf_stream.seek(0)
+        texts = parse_with_llamaparse(pdf_stream, filename)
+        pages = [(i + 1, SOURCE_LLAMAPARSE, text) for i, text in enumerate(texts)]
+        if on_pages:
+            on_pages(pages)
+        return pages, []
+
+    local = read_text_layer(reader)
+    pages = [(i + 1, SOURCE_TEXT_LAYER, text) for i, text in enumerate(local) if text is not None]
+    scanned = [i + 1 for i, text in enumerate(local) if text is None]
+    print(f"📑 {filename}: {len(pages)} page(s) from text layer, {len(scanned)} to LlamaParse")
+    if pages and on_pages:
+        on_pages(pages)
+    failed = []
+    if scanned:
+        remote, failed = parse_remote_pages(reader, scanned, filename, on_pages)
+        pages += remote
+    return sorted(pages), failed
+
+# === Partial Results ===
+def store_pages(pdf_id, pages):
+    with db_cursor(commit=True) as cursor:
+        cursor.executemany("""
+            INSERT INTO parsed_pdf_pages (pdf_id, page_no, source, text)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE source = VALUES(source), text = VALUES(text)
+        """, [(pdf_id, page_no, source, text) for page_no, source, text in pages])
+
+class ParseProgress:
+    # on_pages callback: stores pages as they arrive and tries a local grade match on the
+    # text so far, so a long bundle has parsed_pdfs.grade_id before its last page is back.
+    def __init__(self, pdf_id):
+        self.pdf_id = pdf_id
+        self.pages = []
+        self.grade_id = None
+
+    def __call__(self, pages):
+        self.pages += pages
+        try:
+            store_pages(self.pdf_id, pages)
+            if self.grade_id is None:
+                self.match_grade()
+        except Exception as e:
+            logging.error(f"❌ Storing partial parse of pdf {self.pdf_id} failed: {e}")
+
+    def match_grade(self):
+        candidates, unambiguous = get_grade_index().shortlist(merge_pages(self.pages))
+        if not unambiguous:
+            return
+        self.grade_id, name = candidates[0]
+        with db_cursor(commit=True) as cursor:
+            cursor.execute("UPDATE parsed_pdfs SET grade_id = %s WHERE id = %s AND grade_id IS NULL",
+                           (self.grade_id, self.pdf_id))
+        emit_progress(self.pdf_id, STAGE_GRADE_MATCHED, grade_id=self.grade_id, grade=name, early=True)
+        print(f"🔎 Early grade match for pdf {self.pdf_id}: {name}")
+        logging.info(f"🔎 Early grade match: pdf {self.pdf_id} -> {name} ({self.grade_id})")
+
 # === Process a single PDF ===
 def process_pdf(input_pdf_path, category="Uncategorized"):
     try:
-        print(f"📄 Parsing with LlamaParse: {input_pdf_path}")
-        documents = parser.load_data(input_pdf_path)
-        parsed_text = "\n".join([doc.text for doc in documents])
-        logging.info(f"✅ Parsed {len(parsed_text)} characters from PDF.")
-    except Exception as e:
-        logging.error(f"❌ LlamaParse failed for {input_pdf_path}: {e}")
-        parsed_text = ""
+        content_hash = get_blob_store().put_file(input_pdf_path)
+    except OSError as e:
+        logging.error(f"❌ Failed to store PDF {input_pdf_path}: {e}")
+        return None
+    return process_blob(content_hash, os.path.basename(input_pdf_path), category)
 
+def process_blob(content_hash, filename, category="Uncategorized", pdf_id=None):
     try:
-        with open(input_pdf_path, 'rb') as f:
-            pdf_binary = f.read()
+        ensure_schema()
+    except mysql.connector.Error as err:
+        logging.error(f"❌ Schema setup failed: {err}")
+
+    # Same bytes parsed before: link the row to the existing text instead of re-parsing.
+    cached_id = find_parsed_pdf_by_hash(content_hash, exclude_id=pdf_id) if PARSE_CACHE_ENABLED else None
+    if cached_id:
+        print(f"♻️ Parse cache hit for {filename} (parsed_pdfs.id={cached_id})")
+        logging.info(f"♻️ Parse cache hit: {filename} -> {cached_id}")
+        return save_texts_to_database(
+            filename=filename,
+            category=category,
+            ai_extracted_content=None,
+            content_hash=content_hash,
+            parsed_from_id=cached_id,
+            pdf_id=pdf_id
+        )
+
+    # Reserve the row first so pages can be stored while the rest of the document is parsing.
+    if not pdf_id:
+        pdf_id = save_texts_to_database(filename, category, None, content_hash)
+    progress = ParseProgress(pdf_id) if pdf_id else None
+
+    error = None
+    try:
+        print(f"📄 Parsing: {filename} ({content_hash})")
+        with get_blob_store().open_mapped(content_hash) as pdf_stream:
+            pages, failed_pages = parse_pages(pdf_stream, filename, on_pages=progress)
+        parsed_text = merge_pages(pages)
+        if failed_pages:
+            print(f"⚠️ Partial parse of {filename}: pages {failed_pages} failed, it will not be cached or validated")
+            logging.warning(f"⚠️ Partial parse of {filename} ({content_hash}): pages {failed_pages} failed")
+            error = f"pages {failed_pages} failed to parse"
+        logging.info(f"✅ Parsed {len(parsed_text)} characters from PDF.")
     except Exception as e:
-        logging.error(f"❌ Failed to read PDF binary: {e}")
-        pdf_binary = None
+        logging.error(f"❌ Parsing failed for {filename} ({content_hash}): {e}")
+        pages, parsed_text, failed_pages = None, "", None
+        error = f"parsing failed: {e}"
 
-    save_texts_to_database(
-        filename=os.path.basename(input_pdf_path),
+    pdf_id = save_texts_to_database(
+        filename=filename,
         category=category,
         ai_extracted_content=parsed_text,
-        pdf_binary=pdf_binary
+        content_hash=content_hash,
+        pdf_id=pdf_id,
+        pages=pages,
+        failed_pages=failed_pages
     )
+    if error:
+        raise ParseFailed(error, pdf_id)
+    return pdf_id
 
 # === Process directory ===
-def process_all_pdfs_in_directory(input_dir):
-    for root, _, files in os.walk(input_dir):
-        if root == input_dir:
-            continue  # Skip root folder
-
-        category = os.path.basename(root)
-        for file in files:
-            if file.lower().endswith(".pdf"):
-                full_path = os.path.join(root, file)
-                print(f"✅ Found PDF in '{category}': {full_path}")
-                process_pdf(full_path, category=category)
+def process_all_pdfs_in_directory(input_dir, **options):
+    # Parallel, resumable ingest with a manifest and hash dedupe, see bulk_ingest.py
+    from bulk_ingest import iter_directory_pdfs, run_bulk_ingest, print_summary
+
+    files = list(iter_directory_pdfs(input_dir))
+    for path, category in files:
+        print(f"✅ Found PDF in '{category}': {path}")
+    summary = run_bulk_ingest(files, **options)
+    print_summary(summary)
+    return summary
 
 # === Run ===
 if __name__ == "__main__":
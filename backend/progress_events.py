@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+import pika
+from pika.exceptions import AMQPError
+from dotenv import load_dotenv
+from publisher import QueuePublisher, RABBITMQ_HOST, RABBITMQ_HEARTBEAT
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+PROGRESS_EVENTS_ENABLED = os.getenv("PROGRESS_EVENTS_ENABLED", "true").lower() in ("1", "true", "yes")
+PROGRESS_EXCHANGE = os.getenv("PROGRESS_EXCHANGE", "validation_progress")
+PROGRESS_SUBSCRIBER_BUFFER = int(os.getenv("PROGRESS_SUBSCRIBER_BUFFER", 1000))
+PROGRESS_OUTBOX_SIZE = int(os.getenv("PROGRESS_OUTBOX_SIZE", 10000))
+PROGRESS_PAUSE_SECONDS = 30
+PROGRESS_PUBLISH_BATCH = 100
+PROGRESS_FLUSH_SECONDS = 2
+
+# Per-certificate stage transitions. The API and the consumers publish them to a fanout
+# exchange. Each API process binds one private queue to it and fans the events out in
+# memory to its open /validations/stream clients. The number of browser tabs then costs
+# neither database queries nor broker connections.
+STAGE_QUEUED = "queued"
+STAGE_PARSED = "parsed"
+STAGE_GRADE_MATCHED = "grade_matched"
+STAGE_EXTRACTED = "extracted"
+STAGE_COMPARED = "compared"
+STAGE_ERROR = "error"
+
+# === Publishing ===
+# Best effort: progress is informational and must never fail or slow down the work it reports
+# on. Events go into a bounded in-memory outbox that one background thread per process publishes
+# in batches; a full outbox drops new events, and a broker outage pauses publishing for a while
+# (events meanwhile are dropped) instead of making every worker wait on reconnects.
+_outbox = None
+_outbox_pid = None
+_outbox_lock = threading.Lock()
+_paused_until = 0.0
+_dropped = 0
+
+def _publish_loop(outbox):
+    global _paused_until
+    publisher = QueuePublisher(exchange=PROGRESS_EXCHANGE)
+    while True:
+        batch = [outbox.get()]
+        while len(batch) < PROGRESS_PUBLISH_BATCH:
+            try:
+                batch.append(outbox.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if time.monotonic() >= _paused_until:
+                publisher.publish_batch(batch)
+        except Exception as e:
+            _paused_until = time.monotonic() + PROGRESS_PAUSE_SECONDS
+            logging.warning(f"⚠️ Progress events not published, pausing for {PROGRESS_PAUSE_SECONDS}s: {e!r}")
+        finally:
+            for _ in batch:
+                outbox.task_done()
+
+def _flush_at_exit(outbox):
+    # Give queued events a moment to go out when a script or worker exits.
+    deadline = time.monotonic() + PROGRESS_FLUSH_SECONDS
+    while outbox.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def get_progress_outbox():
+    global _outbox, _outbox_pid
+    if _outbox is None or _outbox_pid != os.getpid():
+        with _outbox_lock:
+            if _outbox is None or _outbox_pid != os.getpid():
+                outbox = queue.Queue(maxsize=PROGRESS_OUTBOX_SIZE)
+                threading.Thread(target=_publish_loop, args=(outbox,), name="progress-publisher", daemon=True).start()
+                atexit.register(_flush_at_exit, outbox)
+                _outbox, _outbox_pid = outbox, os.getpid()
+    return _outbox
+
+def progress_event(pdf_id, stage, **details):
+    return {"pdf_id": pdf_id, "stage": stage, "at": datetime.now(timezone.utc).isoformat(), **details}
+
+def emit_progress_batch(events):
+    global _dropped
+    if not PROGRESS_EVENTS_ENABLED or not events:
+        return
+    outbox = get_progress_outbox()
+    for event in events:
+        try:
+            outbox.put_nowait(event)
+        except queue.Full:
+            _dropped += 1
+            if _dropped % 1000 == 1:
+                logging.warning(f"⚠️ Progress outbox full, {_dropped} event(s) dropped so far")
+
+def emit_progress(pdf_id, stage, **details):
+    emit_progress_batch([progress_event(pdf_id, stage, **details)])
+
+# === In-process Hub ===
+class ProgressHub:
+    # One listener thread per process consumes the exchange through an exclusive, auto-delete
+    # queue and copies every event into the bounded queue of each subscriber. A subscriber that
+    # stops reading loses its oldest events instead of holding up the others.
+    def __init__(self, host=RABBITMQ_HOST, exchange=PROGRESS_EXCHANGE, buffer=PROGRESS_SUBSCRIBER_BUFFER):
+        self.host = host
+        self.exchange = exchange
+        self.buffer = buffer
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.buffer)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name="progress-hub", daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _listen(self):
+        while True:
+            try:
+                connection = pika.BlockingConnection(pika.ConnectionParameters(self.host, heartbeat=RABBITMQ_HEARTBEAT))
+                channel = connection.channel()
+                channel.exchange_declare(exchange=self.exchange, exchange_type="fanout")
+                bound = channel.queue_declare(queue="", exclusive=True, auto_delete=True)
+                channel.queue_bind(exchange=self.exchange, queue=bound.method.queue)
+                logging.info(f"🐇 Progress hub listening on exchange {self.exchange}")
+                for _, _, body in channel.consume(bound.method.queue, auto_ack=True, inactivity_timeout=1):
+                    if body is None:
+                        continue
+                    try:
+                        self.publish(json.loads(body))
+                    except json.JSONDecodeError:
+                        logging.warning(f"⚠️ Malformed progress event dropped: {body[:200]!r}")
+            except AMQPError as e:
+                logging.warning(f"⚠️ Progress hub lost the broker ({e!r}), reconnecting")
+                time.sleep(2)
+
+_hub = None
+_hub_pid = None
+_hub_lock = threading.Lock()
+
+def get_progress_hub():
+    global _hub, _hub_pid
+    if _hub is None or _hub_pid != os.getpid():
+        with _hub_lock:
+            if _hub is None or _hub_pid != os.getpid():
+                _hub = ProgressHub()
+                _hub_pid = os.getpid()
+    return _hub
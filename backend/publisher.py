@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+import threading
+import pika
+from pika.exceptions import AMQPConnectionError, AMQPChannelError
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
+PDF_QUEUE = "pdf_processing"
+RABBITMQ_PUBLISH_RETRIES = int(os.getenv("RABBITMQ_PUBLISH_RETRIES", 3))
+RABBITMQ_HEARTBEAT = int(os.getenv("RABBITMQ_HEARTBEAT", 60))
+
+# === Publisher ===
+class QueuePublisher:
+    # One long-lived connection/channel in transaction mode. A batch is published without
+    # waiting and committed with one tx.commit, so the broker owns every message once
+    # publish_batch returns: one round trip per batch instead of one confirm per message.
+    # A dropped connection is reopened and the uncommitted batch is resent (at-least-once).
+    def __init__(self, host=RABBITMQ_HOST, queue=PDF_QUEUE, exchange=None):
+        # With an exchange, messages go to a fanout exchange instead of the named queue.
+        self.host = host
+        self.queue = queue
+        self.exchange = exchange
+        self._connection = None
+        self._channel = None
+        self._returned = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._close()
+        self._connection = pika.BlockingConnection(
+            pika.ConnectionParameters(self.host, heartbeat=RABBITMQ_HEARTBEAT)
+        )
+        self._channel = self._connection.channel()
+        if self.exchange:
+            self._channel.exchange_declare(exchange=self.exchange, exchange_type="fanout")
+        else:
+            self._channel.queue_declare(queue=self.queue)
+        self._channel.add_on_return_callback(self._on_return)
+        self._channel.tx_select()
+        logging.info(f"🐇 Publisher connected to {self.host} ({f'exchange: {self.exchange}' if self.exchange else f'queue: {self.queue}'})")
+
+    def _on_return(self, channel, method, properties, body):
+        self._returned.append(body)
+
+    def _close(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except AMQPConnectionError:
+            pass
+        self._connection = None
+        self._channel = None
+
+    def _ensure_channel(self):
+        if self._connection is None or self._connection.is_closed or self._channel is None or self._channel.is_closed:
+            self._connect()
+        else:
+            # Services heartbeats missed while the connection sat idle between requests.
+            self._connection.process_data_events(time_limit=0)
+
+    def publish_batch(self, messages):
+        pending = list(messages)
+        attempt = 0
+        with self._lock:
+            while pending:
+                try:
+                    self._ensure_channel()
+                    self._returned = []
+                    for message in pending:
+                        self._channel.basic_publish(
+                            exchange=self.exchange or '',
+                            routing_key='' if self.exchange else self.queue,
+                            body=json.dumps(message),
+                            # A fanout with no listener bound is not an error.
+                            mandatory=not self.exchange
+                        )
+                    self._channel.tx_commit()
+                    # Returns reach the client before tx.commit-ok; this dispatches their callbacks.
+                    self._connection.process_data_events(time_limit=0)
+                    pending = []
+                except (AMQPConnectionError, AMQPChannelError) as e:
+                    attempt += 1
+                    logging.warning(f"⚠️ Publish failed ({e!r}), attempt {attempt}/{RABBITMQ_PUBLISH_RETRIES}")
+                    self._close()
+                    if attempt >= RABBITMQ_PUBLISH_RETRIES:
+                        raise
+                    time.sleep(min(2 ** attempt * 0.1, 2))
+            if self._returned:
+                raise RuntimeError(f"{len(self._returned)} message(s) could not be routed to {self.queue}")
+
+    def publish(self, message):
+        self.publish_batch([message])
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+# === Shared Instance (one per worker process) ===
+_publisher = None
+_publisher_pid = None
+_publisher_lock = threading.Lock()
+
+def get_publisher():
+    global _publisher, _publisher_pid
+    if _publisher is None or _publisher_pid != os.getpid():
+        with _publisher_lock:
+            if _publisher is None or _publisher_pid != os.getpid():
+                _publisher = QueuePublisher()
+                _publisher_pid = os.getpid()
+    return _publisher
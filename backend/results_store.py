@@ -0,0 +1,147 @@
+import json
+import math
+import logging
+from db import db_cursor
+from comparator import compare_certificates_batch
+
+# Extracted values, per-property comparison results and the raw LLM answers are stored per
+# certificate, so reports read them back and edited norms are re-checked without the LLM.
+
+STATUS_CHUNK = 500
+
+# === Extracted Values ===
+def encode_value(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+def decode_value(value):
+    try:
+        decoded = json.loads(value)
+    except (TypeError, json.JSONDecodeError):
+        return value
+    # Plain strings that happen to parse ("0.18") stay strings, as the LLM returned them.
+    return decoded if isinstance(decoded, (dict, list)) else value
+
+def save_extraction(cursor, pdf_id, grade_id, chem_data, mech_data, diameter=None):
+    # Replaces the certificate's stored values; the caller owns the transaction.
+    rows = [(pdf_id, "chemical", i, str(item.get("property_name")), encode_value(item.get("value")))
+            for i, item in enumerate(chem_data)]
+    rows += [(pdf_id, "mechanical", i, str(item.get("property_name")), encode_value(item.get("value")))
+             for i, item in enumerate(mech_data)]
+    cursor.execute("DELETE FROM extracted_values WHERE pdf_id = %s", (pdf_id,))
+    if rows:
+        cursor.executemany("""
+            INSERT INTO extracted_values (pdf_id, kind, position, property_name, value)
+            VALUES (%s, %s, %s, %s, %s)
+        """, rows)
+    cursor.execute("UPDATE parsed_pdfs SET grade_id = %s, product_diameter = %s WHERE id = %s",
+                   (grade_id, diameter, pdf_id))
+
+def load_extractions(grade_id=None, pdf_ids=None):
+    # -> {pdf_id: (grade_id, chem_data, mech_data, diameter)} in the shape compare_certificates_batch takes.
+    clauses, params = [], []
+    if grade_id is not None:
+        clauses.append("p.grade_id = %s")
+        params.append(grade_id)
+    if pdf_ids is not None:
+        if not pdf_ids:
+            return {}
+        clauses.append(f"p.id IN ({', '.join(['%s'] * len(pdf_ids))})")
+        params.extend(pdf_ids)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with db_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT p.id, p.grade_id, p.product_diameter, e.kind, e.property_name, e.value
+            FROM parsed_pdfs p
+            JOIN extracted_values e ON e.pdf_id = p.id
+            {where}
+            ORDER BY p.id, e.kind, e.position
+        """, params)
+        rows = cursor.fetchall()
+
+    extractions = {}
+    for pdf_id, row_grade_id, diameter, kind, name, value in rows:
+        if pdf_id not in extractions:
+            extractions[pdf_id] = (row_grade_id, [], [], diameter)
+        items = extractions[pdf_id][1] if kind == "chemical" else extractions[pdf_id][2]
+        items.append({"property_name": name, "value": decode_value(value)})
+    return extractions
+
+# === Validation Status ===
+def write_validation_statuses(cursor, statuses):
+    # statuses: {pdf_id: "passed" | "failed" | "pending" | "error"}. One multi-row upsert per
+    # chunk on the unique certificate_id key, so concurrent writers never create a second row.
+    pdf_ids = list(statuses)
+    for start in range(0, len(pdf_ids), STATUS_CHUNK):
+        chunk = pdf_ids[start:start + STATUS_CHUNK]
+        cursor.execute(f"""
+            INSERT INTO validations (certificate_id, status)
+            VALUES {', '.join(['(%s, %s)'] * len(chunk))}
+            ON DUPLICATE KEY UPDATE status = VALUES(status)
+        """, [value for pdf_id in chunk for value in (pdf_id, statuses[pdf_id])])
+
+# === Comparison Results ===
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+def comparison_rows(pdf_id, kind, results):
+    rows = []
+    for position, row in enumerate(results.to_dict("records")):
+        if kind == "chemical":
+            name, sample_min, sample_max = row["element"], row["sample_min"], row["sample_max"]
+            standard_min, standard_max = row["min_value"], row["max_value"]
+        else:
+            name, sample_min, sample_max = row["property"], row["sample_min"], row["sample_max"]
+            standard_min, standard_max = row["standard_min"], row["standard_max"]
+        rows.append((pdf_id, kind, position, str(name), _number(sample_min), _number(sample_max),
+                     _number(standard_min), _number(standard_max), row["result"]))
+    return rows
+
+def save_results(cursor, results, raw_responses=None):
+    # results: {pdf_id: (chem_df, mech_df, all_ok)}; raw_responses: {pdf_id: {kind: answer}}.
+    # Replaces the stored comparison rows and sets the validation status, all in the caller's transaction.
+    pdf_ids = list(results)
+    if not pdf_ids:
+        return {}
+    rows = []
+    for pdf_id, (chem_df, mech_df, _) in results.items():
+        rows += comparison_rows(pdf_id, "chemical", chem_df)
+        rows += comparison_rows(pdf_id, "mechanical", mech_df)
+
+    for start in range(0, len(pdf_ids), STATUS_CHUNK):
+        chunk = pdf_ids[start:start + STATUS_CHUNK]
+        cursor.execute(f"DELETE FROM comparison_results WHERE pdf_id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+    if rows:
+        cursor.executemany("""
+            INSERT INTO comparison_results (pdf_id, kind, position, property_name, sample_min, sample_max,
+                                            standard_min, standard_max, result)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, rows)
+
+    raw_rows = [(pdf_id, kind, answer) for pdf_id, answers in (raw_responses or {}).items()
+                for kind, answer in answers.items() if answer is not None]
+    if raw_rows:
+        cursor.executemany("INSERT INTO llm_extractions (pdf_id, kind, raw_response) VALUES (%s, %s, %s)", raw_rows)
+
+    statuses = {pdf_id: "passed" if all_ok else "failed" for pdf_id, (_, _, all_ok) in results.items()}
+    write_validation_statuses(cursor, statuses)
+    return statuses
+
+def record_status(pdf_id, status):
+    with db_cursor(commit=True) as cursor:
+        write_validation_statuses(cursor, {pdf_id: status})
+
+# === Re-validation ===
+def revalidate(extractions):
+    if not extractions:
+        return {}
+    results = compare_certificates_batch(extractions)
+    with db_cursor(commit=True) as cursor:
+        return save_results(cursor, results)
+
+def revalidate_grade(grade_id):
+    # Re-compares every certificate matched to the grade against its current norms.
+    statuses = revalidate(load_extractions(grade_id=grade_id))
+    logging.info(f"🔁 Re-validated {len(statuses)} certificate(s) for grade {grade_id}")
+    return statuses
@@ -0,0 +1,202 @@
+import logging
+import threading
+from db import db_connection
+
+# Idempotent schema setup, run once per process instead of before every insert.
+# MySQL has no "ADD COLUMN IF NOT EXISTS", so columns and indexes are checked in information_schema.
+
+# === Helpers ===
+def table_exists(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+def add_column(cursor, table, column, definition):
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logging.info(f"🛠 Added column {table}.{column}")
+
+def add_index(cursor, table, index, columns, unique=False):
+    if not index_exists(cursor, table, index):
+        cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {index} ON {table} ({columns})")
+        logging.info(f"🛠 Added {'unique ' if unique else ''}index {index} on {table}({columns})")
+
+def drop_index(cursor, table, index):
+    if index_exists(cursor, table, index):
+        cursor.execute(f"DROP INDEX {index} ON {table}")
+        logging.info(f"🛠 Dropped index {index} on {table}")
+
+# === Tables ===
+def ensure_parsed_pdfs(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS parsed_pdfs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            category VARCHAR(255),
+            category_id INT,
+            ai_extracted_data LONGTEXT,
+            content_hash CHAR(64),
+            parsed_from_id INT,
+            upload_batch CHAR(32),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    add_column(cursor, "parsed_pdfs", "content_hash", "CHAR(64) NULL")
+    add_column(cursor, "parsed_pdfs", "parsed_from_id", "INT NULL")
+    add_column(cursor, "parsed_pdfs", "upload_batch", "CHAR(32) NULL")
+    add_index(cursor, "parsed_pdfs", "idx_parsed_pdfs_content_hash", "content_hash")
+    add_index(cursor, "parsed_pdfs", "idx_parsed_pdfs_upload_batch", "upload_batch")
+
+    # Validations are listed by category id; rows from before the column existed are matched by name once.
+    if not column_exists(cursor, "parsed_pdfs", "category_id"):
+        add_column(cursor, "parsed_pdfs", "category_id", "INT NULL")
+        if table_exists(cursor, "categories"):
+            cursor.execute("""
+                UPDATE parsed_pdfs p
+                JOIN categories c ON c.name = p.category
+                SET p.category_id = c.id
+            """)
+            logging.info(f"🛠 Backfilled parsed_pdfs.category_id for {cursor.rowcount} rows")
+    add_index(cursor, "parsed_pdfs", "idx_parsed_pdfs_category_id", "category_id, id")
+
+    # Grade and product diameter matched at extraction time, used for re-validation after norm edits.
+    add_column(cursor, "parsed_pdfs", "grade_id", "INT NULL")
+    add_column(cursor, "parsed_pdfs", "product_diameter", "DOUBLE NULL")
+    add_index(cursor, "parsed_pdfs", "idx_parsed_pdfs_grade_id", "grade_id")
+
+    # Comma-separated pages the remote parser failed on; set means the text is incomplete.
+    add_column(cursor, "parsed_pdfs", "parse_failed_pages", "VARCHAR(1024) NULL")
+
+def ensure_parsed_pdf_pages(cursor):
+    # Text per page and the path it took: the embedded text layer or LlamaParse.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS parsed_pdf_pages (
+            pdf_id INT NOT NULL,
+            page_no INT NOT NULL,
+            source VARCHAR(16) NOT NULL,
+            text LONGTEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (pdf_id, page_no)
+        )
+    """)
+
+def ensure_validations(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS validations (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            certificate_id INT NOT NULL,
+            status VARCHAR(32) NOT NULL DEFAULT 'pending',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    add_index(cursor, "validations", "idx_validations_created", "created_at, id")
+    add_index(cursor, "validations", "idx_validations_status_created", "status, created_at, id")
+    # One status row per certificate, so concurrent writers upsert instead of inserting twice.
+    if not index_exists(cursor, "validations", "uq_validations_certificate"):
+        # Duplicates written before the key existed: keep the first row of each certificate.
+        cursor.execute("""
+            DELETE v FROM validations v
+            JOIN validations kept ON kept.certificate_id = v.certificate_id AND kept.id < v.id
+        """)
+        add_index(cursor, "validations", "uq_validations_certificate", "certificate_id", unique=True)
+    drop_index(cursor, "validations", "idx_validations_certificate")
+
+def ensure_extracted_values(cursor):
+    # Values as extracted per certificate, so edited norms can be re-checked without the LLM.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS extracted_values (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            pdf_id INT NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            position INT NOT NULL,
+            property_name VARCHAR(255) NOT NULL,
+            value TEXT,
+            INDEX idx_extracted_values_pdf (pdf_id, kind, position)
+        )
+    """)
+
+def ensure_comparison_results(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS comparison_results (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            pdf_id INT NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            position INT NOT NULL,
+            property_name VARCHAR(255) NOT NULL,
+            sample_min DOUBLE,
+            sample_max DOUBLE,
+            standard_min DOUBLE,
+            standard_max DOUBLE,
+            result VARCHAR(64) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_comparison_results_pdf (pdf_id, kind, position)
+        )
+    """)
+    # Raw LLM answers, kept for auditing and re-parsing; one row per call.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_extractions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            pdf_id INT NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            raw_response LONGTEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_llm_extractions_pdf (pdf_id)
+        )
+    """)
+
+def ensure_norms_version(cursor):
+    # Single-row counter bumped on every change to the limit tables, see norms_cache.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS norms_version (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT IGNORE INTO norms_version (id, version) VALUES (1, 0)")
+
+SCHEMA_STEPS = [
+    ensure_parsed_pdfs,
+    ensure_parsed_pdf_pages,
+    ensure_norms_version,
+    ensure_validations,
+    ensure_extracted_values,
+    ensure_comparison_results,
+]
+
+# === Runner ===
+_ensured = False
+_ensure_lock = threading.Lock()
+
+def ensure_schema():
+    global _ensured
+    if _ensured:
+        return
+    with _ensure_lock:
+        if _ensured:
+            return
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for step in SCHEMA_STEPS:
+                    step(cursor)
+                conn.commit()
+            finally:
+                cursor.close()
+        _ensured = True
@@ -0,0 +1,110 @@
+import os
+import re
+from dotenv import load_dotenv
+from llm_scheduler import LLM_CHARS_PER_TOKEN
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+PROMPT_WINDOWS_ENABLED = os.getenv("PROMPT_WINDOWS_ENABLED", "true").lower() in ("1", "true", "yes")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 3000))
+SECTION_MIN_CHARS = 300
+SECTION_MAX_CHARS = 1500
+
+# Certificates carry addresses, stamps and terms next to the few blocks an extraction needs.
+# The parsed text is cut into sections, each section is scored for the task (norm names found
+# in it, task keywords, density of numbers) and the best ones are kept, in document order,
+# until the token budget is used. Texts already within the budget are sent unchanged.
+
+# === Task Keywords ===
+TASK_KEYWORDS = {
+    "grade": ["grade", "steel", "material", "quality", "specification", "standard", "werkstoff",
+              "stahlsorte", "sorte", "en 10", "astm", "din", "iso", "product", "dimension"],
+    "chemical": ["chemical", "composition", "analysis", "heat", "ladle", "cast", "product analysis",
+                 "chemische", "zusammensetzung", "schmelze", "%"],
+    "mechanical": ["tensile", "yield", "elongation", "impact", "hardness", "mechanical", "mpa",
+                   "n/mm", "rm", "reh", "rp0", "kv", "charpy", "zugfestigkeit", "streckgrenze",
+                   "dehnung", "kerbschlag", "härte"]
+}
+TASK_KEYWORDS["all"] = TASK_KEYWORDS["grade"] + TASK_KEYWORDS["chemical"] + TASK_KEYWORDS["mechanical"]
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+def text_tokens(text):
+    return len(text) / LLM_CHARS_PER_TOKEN
+
+# === Sections ===
+def split_sections(text):
+    # Blank-line paragraphs, small ones merged with the next, long ones cut at line boundaries.
+    sections, current = [], ""
+    for block in re.split(r"\n\s*\n|\f", text):
+        block = block.strip("\n")
+        if not block.strip():
+            continue
+        current = f"{current}\n{block}" if current else block
+        if len(current) >= SECTION_MIN_CHARS:
+            sections.extend(_cut(current))
+            current = ""
+    if current:
+        sections.extend(_cut(current))
+    return sections
+
+def _cut(section):
+    if len(section) <= SECTION_MAX_CHARS:
+        return [section]
+    pieces, current = [], []
+    size = 0
+    for line in section.split("\n"):
+        if current and size + len(line) > SECTION_MAX_CHARS:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+# === Scoring ===
+def term_pattern(terms):
+    # Short names (element symbols: C, S, Mn) must match case and stand alone; longer names ignore case.
+    short = sorted({t for t in terms if t and len(t) <= 2}, key=len, reverse=True)
+    long = sorted({t for t in terms if t and len(t) > 2}, key=len, reverse=True)
+    parts = []
+    if short:
+        parts.append(r"(?<![A-Za-z])(?:" + "|".join(map(re.escape, short)) + r")(?![a-z])")
+    if long:
+        parts.append(r"(?i:" + "|".join(map(re.escape, long)) + r")")
+    return re.compile("|".join(parts)) if parts else None
+
+def score_section(section, pattern, keywords):
+    lowered = section.lower()
+    score = 0.0
+    if pattern:
+        score += 3 * len(set(m.group(0) for m in pattern.finditer(section)))
+    score += sum(1 for keyword in keywords if keyword in lowered)
+    # Value tables are dense in numbers; prose, addresses and legal text are not.
+    numbers = len(_NUMBER.findall(section))
+    score += min(numbers / max(len(section.split()), 1), 1.0) * 4
+    return score
+
+def build_prompt_text(text, task, terms=(), budget_tokens=PROMPT_TOKEN_BUDGET):
+    if not PROMPT_WINDOWS_ENABLED or not text or text_tokens(text) <= budget_tokens:
+        return text
+
+    sections = split_sections(text)
+    pattern = term_pattern([str(t) for t in terms])
+    keywords = TASK_KEYWORDS.get(task, [])
+    ranked = sorted(range(len(sections)), key=lambda i: (-score_section(sections[i], pattern, keywords), i))
+
+    chosen, used = set(), 0.0
+    for i in ranked:
+        cost = text_tokens(sections[i])
+        if used + cost > budget_tokens:
+            continue
+        chosen.add(i)
+        used += cost
+    if not chosen:
+        # Not even one section fits: keep the start of the best one.
+        return sections[ranked[0]][:int(budget_tokens * LLM_CHARS_PER_TOKEN)]
+    return "\n[...]\n".join(sections[i] for i in sorted(chosen))
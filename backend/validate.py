@@ -1,85 +1,76 @@
 import os
 import json
 import re
-import requests
-import pandas as pd
-import pymysql
-import mysql.connector
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from db import db_cursor
+from grade_index import get_grade_index
+from chem_extractor import extract_local_chemistry, merge_chemistry
+from comparator import compare_properties_batch
+from norms_cache import get_norms_cache
+from results_store import save_extraction, save_results, record_status
+from schema import ensure_schema
+from llm_client import get_llm_client, LLMUnavailable
+from text_windows import build_prompt_text, PROMPT_TOKEN_BUDGET
+from progress_events import emit_progress, STAGE_GRADE_MATCHED, STAGE_EXTRACTED, STAGE_COMPARED, STAGE_ERROR
 
 # === Load environment variables ===
 load_dotenv()
 
 # === Config ===
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-1.5-flash")
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "46.4.73.18"),
-    "user": os.getenv("DB_USER", "root"),
-    "password": os.getenv("DB_PASSWORD", "TX1wQ391RQ&P"),
-    "database": os.getenv("DB_NAME", "blackforest"),
-    "port": int(os.getenv("DB_PORT", 3306))
-}
-
-# === DB Connection ===
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+SINGLE_PASS_EXTRACTION = os.getenv("SINGLE_PASS_EXTRACTION", "false").lower() in ("1", "true", "yes")
 
+# === DB Access (pooled, see db.py) ===
 def get_extracted_text_from_db(pdf_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT ai_extracted_data FROM parsed_pdfs WHERE id = %s", (pdf_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with db_cursor() as cursor:
+        # Parse-cache hits link to the row holding the text instead of copying it.
+        cursor.execute("""
+            SELECT COALESCE(src.ai_extracted_data, p.ai_extracted_data)
+            FROM parsed_pdfs p
+            LEFT JOIN parsed_pdfs src ON src.id = p.parsed_from_id
+            WHERE p.id = %s
+        """, (pdf_id,))
+        row = cursor.fetchone()
     return row[0] if row else None
 
-def get_all_material_names():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT grade_name FROM materials")
-    rows = cursor.fetchall()
-    conn.close()
-    return [row[0] for row in rows if row[0]]
-
-def get_material_id_by_grade(grade_name):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM materials WHERE grade_name = %s", (grade_name,))
-    row = cursor.fetchone()
-    conn.close()
+def get_failed_parse_pages(pdf_id):
+    with db_cursor() as cursor:
+        cursor.execute("SELECT parse_failed_pages FROM parsed_pdfs WHERE id = %s", (pdf_id,))
+        row = cursor.fetchone()
     return row[0] if row else None
 
 # === LLM Call ===
-def call_openrouter_agent(prompt, system_message):
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    body = {
-        "model": OPENROUTER_MODEL,
-        "messages": [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt}
-        ]
-    }
-    response = requests.post(url, json=body, headers=headers)
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"].strip()
+def call_openrouter_agent(prompt, system_message, response_format=None, use_cache=True):
+    # Pooled keep-alive session with timeouts, retries and an on-disk response cache, see llm_client.py
+    return get_llm_client().complete(prompt, system_message, response_format=response_format, use_cache=use_cache)
 
 # === Grade Matching ===
-def find_material_with_agent(pdf_id):
-    text = get_extracted_text_from_db(pdf_id)
+def find_material_with_agent(pdf_id, text=None):
+    if text is None:
+        text = get_extracted_text_from_db(pdf_id)
     if not text:
         print("❌ No extracted text.")
         return None, None
 
-    material_list = get_all_material_names()
-    if not material_list:
+    index = get_grade_index()
+    if not len(index):
         print("❌ No material names found.")
         return None, None
 
+    candidates, unambiguous = index.shortlist(text)
+    if unambiguous:
+        grade_id, matched_name = candidates[0]
+        print("🔎 Unambiguous grade found in text:", matched_name)
+        return matched_name, grade_id
+    if not candidates:
+        candidates = index.fallback_candidates(text)
+        print(f"🔎 No close grade names in text, asking with {len(candidates)} loose candidates.")
+    if not candidates:
+        print("❌ No grade candidates found in text.")
+        return None, None
+    material_list = [name for _, name in candidates]
+    text = build_prompt_text(text, "grade", material_list)
+
     prompt = f"""
 You are a material grade recognition assistant.
 
@@ -98,33 +89,36 @@ Return the best matching grade name as a CSV string, like: "S355J2"
     try:
         response = call_openrouter_agent(prompt, "You are an expert in identifying material grades in test report documents.")
         print("🤖 Material Match Response:", response)
-        matched_name = (response)
-        grade_id = get_material_id_by_grade(matched_name)
-        print
+        grade_id, matched_name = index.resolve(response)
         return matched_name, grade_id
+    except LLMUnavailable:
+        raise
     except Exception as e:
         print("❌ LLM material match failed:", e)
         return None, None
 
 # === Property Names ===
 def get_chemical_property_names(grade_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT element FROM chemical_properties WHERE grade_id = %s", (grade_id,))
-    elements = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return elements
+    return get_norms_cache().property_names("chemical", grade_id)
 
 def get_mechanical_property_names(grade_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT property_name FROM mechanical_properties WHERE grade_id = %s", (grade_id,))
-    props = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    return get_norms_cache().property_names("mechanical", grade_id)
+
+def get_all_chemical_property_names():
+    with db_cursor() as cursor:
+        cursor.execute("SELECT DISTINCT element FROM chemical_properties")
+        elements = [row[0] for row in cursor.fetchall() if row[0]]
+    return elements
+
+def get_all_mechanical_property_names():
+    with db_cursor() as cursor:
+        cursor.execute("SELECT DISTINCT property_name FROM mechanical_properties")
+        props = [row[0] for row in cursor.fetchall() if row[0]]
     return props
 
 # === Extractors ===
 def extract_chemical_properties(text, material_name, property_names):
+    text = build_prompt_text(text, "chemical", property_names)
     prop_str = ", ".join(property_names)
     prompt = f"""
 You are a chemical properties extraction assistant.
@@ -146,6 +140,7 @@ Return a JSON list of objects, each with:
     return call_openrouter_agent(prompt, "You are an expert in extracting chemical composition values from material test reports. Respond in JSON format.")
 
 def extract_mechanical_properties(text, material_name, property_names):
+    text = build_prompt_text(text, "mechanical", property_names)
     prop_str = ", ".join(property_names)
     prompt = f"""
 You are a mechanical properties extraction assistant.
@@ -166,49 +161,161 @@ Return a JSON list of objects, each with:
 """
     return call_openrouter_agent(prompt, "You are an expert in extracting mechanical test values from engineering reports. Respond in JSON format.")
 
+# === Single-Pass Extraction ===
+PROPERTY_LIST_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "property_name": {"type": "string"},
+            "value": {"type": "string"}
+        },
+        "required": ["property_name", "value"],
+        "additionalProperties": False
+    }
+}
+
+COMBINED_EXTRACTION_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "certificate_extraction",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "grade_name": {"type": "string"},
+                "chemical": PROPERTY_LIST_SCHEMA,
+                "mechanical": PROPERTY_LIST_SCHEMA
+            },
+            "required": ["grade_name", "chemical", "mechanical"],
+            "additionalProperties": False
+        }
+    }
+}
+
+def extract_all_properties(text, material_list, chem_names, mech_names):
+    # One prompt covers grade, composition and mechanical values, so it gets the three budgets.
+    text = build_prompt_text(text, "all", list(material_list) + list(chem_names) + list(mech_names),
+                             budget_tokens=3 * PROMPT_TOKEN_BUDGET)
+    prompt = f"""
+You are a material test report extraction assistant.
+
+Text:
+---
+{text}
+---
+
+1. Identify the material grade of the certified product. It **must match exactly** one of these names:
+{chr(10).join(f"- {name}" for name in material_list)}
+
+2. Extract the chemical composition values for any of these elements that appear in the text:
+{", ".join(chem_names)}
+
+3. Extract the mechanical test values for any of these properties that appear in the text:
+{", ".join(mech_names)}
+
+Return a JSON object with:
+- "grade_name": the matched grade name
+- "chemical": a list of objects with "property_name" and "value"
+- "mechanical": a list of objects with "property_name" and "value"
+
+Write each value as a string. If several measurements exist for one property, give the range as "min - max".
+"""
+    return call_openrouter_agent(
+        prompt,
+        "You are an expert in identifying material grades and extracting test values from material test reports. Respond in JSON format.",
+        response_format=COMBINED_EXTRACTION_FORMAT
+    )
+
+def parse_combined_extraction(raw, material_list):
+    # Returns None when the answer does not satisfy COMBINED_EXTRACTION_FORMAT.
+    try:
+        data = json.loads(clean_json_text(raw))
+    except (TypeError, json.JSONDecodeError):
+        return None
+
+    if not isinstance(data, dict):
+        return None
+    grade_name = data.get("grade_name")
+    if not isinstance(grade_name, str) or grade_name.strip() not in material_list:
+        return None
+
+    for key in ("chemical", "mechanical"):
+        items = data.get(key)
+        if not isinstance(items, list):
+            return None
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get("property_name"), str):
+                return None
+            if isinstance(item.get("value"), bool) or not isinstance(item.get("value"), (str, int, float)):
+                return None
+
+    data["grade_name"] = grade_name.strip()
+    return data
+
+def extract_single_pass(text):
+    index = get_grade_index()
+    candidates, _ = index.shortlist(text)
+    if not candidates:
+        print("❌ No grade candidates found in text.")
+        return None
+    material_list = [name for _, name in candidates]
+
+    raw = extract_all_properties(text, material_list,
+                                 get_all_chemical_property_names(),
+                                 get_all_mechanical_property_names())
+    print("📦 RAW COMBINED JSON:\n", raw)
+
+    data = parse_combined_extraction(raw, material_list)
+    if data is None:
+        print("⚠️ Combined answer failed schema validation, falling back to three-call extraction.")
+        return None
+
+    grade_id, material_name = index.resolve(data["grade_name"])
+    if not grade_id:
+        return None
+
+    # The prompt lists the whole catalogue's property names; keep only the matched grade's.
+    chem_names = set(get_chemical_property_names(grade_id))
+    mech_names = set(get_mechanical_property_names(grade_id))
+    chem_data = [item for item in data["chemical"] if item["property_name"] in chem_names]
+    mech_data = normalize_mechanical_data([item for item in data["mechanical"] if item["property_name"] in mech_names])
+
+    # Values read directly from the composition table take precedence over the LLM's.
+    local_chem, _ = extract_local_chemistry(text, chem_names)
+    chem_data = merge_chemistry(local_chem, chem_data)
+    return material_name, grade_id, chem_data, mech_data, {"combined": raw}
+
 # === JSON Cleaning ===
 def clean_json_text(text):
     return re.sub(r"^```(?:json)?|```$", "", text.strip(), flags=re.MULTILINE)
 
 # === Value Helpers ===
-def extract_value_range(value):
-    if isinstance(value, dict):
-        try:
-            min_val = value.get("min")
-            max_val = value.get("max")
-            return float(min_val) if min_val is not None else None, \
-                   float(max_val) if max_val is not None else None
-        except:
-            return None, None
-
-    if isinstance(value, (int, float)):
-        return float(value), float(value)
-
-    if isinstance(value, str):
-        value = value.replace(",", ".")
-        found = re.findall(r"[-+]?\d*\.\d+|\d+", value)
-        if len(found) == 1:
-            val = float(found[0])
-            return val, val
-        elif len(found) >= 2:
-            return float(found[0]), float(found[1])
-    return None, None
-
-
-def parse_diameter_range(diameter_text):
-    if pd.isna(diameter_text): return (None, None)
-    text = diameter_text.strip().replace(" ", "")
-    try:
-        if ">" in text and "≤" in text:
-            parts = text.split(",")
-            return tuple(float(p.replace(">", "").replace("≤", "").strip()) for p in parts)
-        elif text.startswith("≤"):
-            return (None, float(text.replace("≤", "").strip()))
-        elif text.startswith(">"):
-            return (float(text.replace(">", "").strip()), None)
-    except:
-        return (None, None)
-    return (None, None)
+# A number only counts as the diameter next to an Ø/⌀ marker or a mm unit; keywords are whole
+# words, so "India 411001" or "Claudia 12" never match "dia".
+_DIAMETER_PATTERNS = [
+    re.compile(r"\b(?:diameter|durchmesser|dia|thickness|dicke|nominal\s+size|dimensions?|size)\b\.?\s*"
+               r"(?P<unit1>\(mm\))?\s*[:=]?\s*(?P<mark>Ø|⌀)?\s*(?P<value>\d+(?:[.,]\d+)?)(?P<unit2>\s*mm\b)?", re.IGNORECASE),
+    re.compile(r"(?P<mark>Ø|⌀)\s*(?P<value>\d+(?:[.,]\d+)?)"),
+    re.compile(r"(?P<value>\d+(?:[.,]\d+)?)\s*(?P<unit2>mm)\s*(?:Ø|⌀|\bdia\b)", re.IGNORECASE),
+]
+DIAMETER_RANGE_MM = (0.5, 2000.0)
+
+def find_product_diameter(text):
+    # Product diameter/thickness in mm, used to pick the mechanical limit band. None when it is
+    # not stated or the candidates disagree, which keeps the first-row limits.
+    if not text:
+        return None
+    found = set()
+    for pattern in _DIAMETER_PATTERNS:
+        for match in pattern.finditer(text):
+            groups = match.groupdict()
+            if not (groups.get("mark") or groups.get("unit1") or groups.get("unit2")):
+                continue
+            value = float(match.group("value").replace(",", "."))
+            if DIAMETER_RANGE_MM[0] <= value <= DIAMETER_RANGE_MM[1]:
+                found.add(value)
+    return found.pop() if len(found) == 1 else None
 
 def normalize_mechanical_data(mech_data):
     normalized = []
@@ -256,152 +363,38 @@ def normalize_mechanical_data(mech_data):
     return normalized
 
 
-# === Comparators ===
+# === Comparators (vectorized batch engine, see comparator.py) ===
 def compare_chemical_properties(sample_data, grade_id):
-    conn = pymysql.connect(**DB_CONFIG)
-    df = pd.read_sql("SELECT element, min_value, max_value FROM chemical_properties WHERE grade_id = %s", conn, params=[grade_id])
-    conn.close()
-
-    df['min_value'] = pd.to_numeric(df['min_value'], errors='coerce')
-    df['max_value'] = pd.to_numeric(df['max_value'], errors='coerce')
-
-    results = []
-    all_within_range = True
-
-    for item in sample_data:
-        name = item["property_name"]
-        val_min, val_max = extract_value_range(item["value"])
-        row = df[df["element"] == name]
-
-        if val_min is None and val_max is None:
-            result = "INVALID SAMPLE VALUE"
-            std_min = std_max = None
-            all_within_range = False
-        elif row.empty:
-            result = "ELEMENT NOT FOUND IN STANDARD"
-            std_min = std_max = None
-            all_within_range = False
-        else:
-            std_min = row.iloc[0]["min_value"]
-            std_max = row.iloc[0]["max_value"]
-
-            if pd.notna(std_min) and pd.notna(std_max):
-                if val_min >= std_min and val_max <= std_max:
-                    result = "WITHIN RANGE"
-                elif val_max < std_min or val_min > std_max:
-                    result = "NOT WITHIN RANGE"
-                    all_within_range = False
-                else:
-                    result = "PARTIALLY WITHIN RANGE"
-                    all_within_range = False
-            elif pd.isna(std_min) and pd.notna(std_max):
-                if val_max <= std_max:
-                    result = "WITHIN RANGE"
-                else:
-                    result = "NOT WITHIN RANGE"
-                    all_within_range = False
-            elif pd.notna(std_min) and pd.isna(std_max):
-                if val_min >= std_min:
-                    result = "WITHIN RANGE"
-                else:
-                    result = "NOT WITHIN RANGE"
-                    all_within_range = False
-            else:
-                result = "NO STANDARD LIMITS"
-                all_within_range = False
-
-        results.append({
-            "element": name,
-            "sample_value": f"{val_min} - {val_max}" if val_min is not None else "None",
-            "min_value": std_min,
-            "max_value": std_max,
-            "result": result
-        })
-
-    return pd.DataFrame(results), all_within_range
-
-
-def compare_mechanical_properties(sample_data, grade_id):
-    conn = pymysql.connect(**DB_CONFIG)
-    df = pd.read_sql("SELECT property_name, min_value, max_value FROM mechanical_properties WHERE grade_id = %s", conn, params=[grade_id])
-    conn.close()
-
-    df['min_value'] = pd.to_numeric(df['min_value'], errors='coerce')
-    df['max_value'] = pd.to_numeric(df['max_value'], errors='coerce')
-
-    results = []
-    all_within_range = True
-
-    for item in sample_data:
-        prop = item["property_name"]
-        val_min, val_max = extract_value_range(item["value"])
-        applicable_rows = df[df["property_name"] == prop]
-
-        if val_min is None and val_max is None:
-            result = "INVALID SAMPLE VALUE"
-            std_min = std_max = None
-            all_within_range = False
-        elif applicable_rows.empty:
-            result = "NOT FOUND IN STANDARD"
-            std_min = std_max = None
-            all_within_range = False
-        else:
-            row = applicable_rows.iloc[0]
-            std_min, std_max = row["min_value"], row["max_value"]
-
-            if pd.notna(std_min) and pd.notna(std_max):
-                if val_min >= std_min and val_max <= std_max:
-                    result = "WITHIN RANGE"
-                elif val_max < std_min or val_min > std_max:
-                    result = "NOT WITHIN RANGE"
-                    all_within_range = False
-                else:
-                    result = "PARTIALLY WITHIN RANGE"
-                    all_within_range = False
-            elif pd.isna(std_min) and pd.notna(std_max):
-                if val_max <= std_max:
-                    result = "WITHIN RANGE"
-                else:
-                    result = "NOT WITHIN RANGE"
-                    all_within_range = False
-            elif pd.notna(std_min) and pd.isna(std_max):
-                if val_min >= std_min:
-                    result = "WITHIN RANGE"
-                else:
-                    result = "NOT WITHIN RANGE"
-                    all_within_range = False
-            else:
-                result = "NO STANDARD LIMITS"
-                all_within_range = False
-
-        results.append({
-            "property": prop,
-            "sample_min": val_min,
-            "sample_max": val_max,
-            "standard_min": std_min,
-            "standard_max": std_max,
-            "result": result
-        })
-
-    return pd.DataFrame(results), all_within_range
+    return compare_properties_batch("chemical", [(grade_id, grade_id, sample_data)])[grade_id]
+
+def compare_mechanical_properties(sample_data, grade_id, diameter=None):
+    return compare_properties_batch("mechanical", [(grade_id, grade_id, sample_data)], diameters={grade_id: diameter})[grade_id]
 
 # === Master Runner ===
-def extract_and_compare(pdf_id):
-    material_name, grade_id = find_material_with_agent(pdf_id)
+def mark_error(pdf_id, reason):
+    record_status(pdf_id, "error")
+    emit_progress(pdf_id, STAGE_ERROR, reason=reason)
+
+def extract_multi_pass(pdf_id, text):
+    material_name, grade_id = find_material_with_agent(pdf_id, text)
     if not material_name or not grade_id:
         print("❌ Material not matched.")
         return None
-
-    text = get_extracted_text_from_db(pdf_id)
-    if not text:
-        print("❌ Text not found.")
-        return None
+    emit_progress(pdf_id, STAGE_GRADE_MATCHED, grade_id=grade_id, grade=material_name)
 
     chem_names = get_chemical_property_names(grade_id)
     mech_names = get_mechanical_property_names(grade_id)
 
-    chem_json = extract_chemical_properties(text, material_name, chem_names)
-    mech_json = extract_mechanical_properties(text, material_name, mech_names)
+    # Chemistry is read from the composition table where possible; only unresolved elements go to the LLM.
+    local_chem, missing_chem = extract_local_chemistry(text, chem_names)
+    print(f"🧪 Local chemistry: {len(local_chem)} resolved, {len(missing_chem)} left for the LLM")
+
+    # The two extractions are independent, so they share the pooled client concurrently.
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        chem_future = pool.submit(extract_chemical_properties, text, material_name, missing_chem) if missing_chem else None
+        mech_future = pool.submit(extract_mechanical_properties, text, material_name, mech_names)
+        chem_json = chem_future.result() if chem_future else "[]"
+        mech_json = mech_future.result()
 
     print("📦 RAW CHEMICAL JSON:\n", chem_json)
     print("📦 RAW MECHANICAL JSON:\n", mech_json)
@@ -414,21 +407,81 @@ def extract_and_compare(pdf_id):
         print("❌ Failed to parse JSON:", e)
         return None
 
-    chem_results, chem_ok = compare_chemical_properties(chem_data, grade_id)
-    mech_results, mech_ok = compare_mechanical_properties(mech_data, grade_id)
+    chem_data = merge_chemistry(local_chem, chem_data)
+    raw = {"chemical": chem_json if chem_future else None, "mechanical": mech_json}
+    return material_name, grade_id, chem_data, mech_data, raw
+
+def extract_and_compare(pdf_id, single_pass=None):
+    if single_pass is None:
+        single_pass = SINGLE_PASS_EXTRACTION
+
+    ensure_schema()
+    text = get_extracted_text_from_db(pdf_id)
+    if not text:
+        print("❌ Text not found.")
+        mark_error(pdf_id, "no parsed text")
+        return None
+    failed_pages = get_failed_parse_pages(pdf_id)
+    if failed_pages:
+        # Validating an incomplete text would pass or fail the certificate on missing pages.
+        print(f"❌ Parse incomplete, pages {failed_pages} failed.")
+        mark_error(pdf_id, f"pages {failed_pages} failed to parse")
+        return None
 
+    extracted = None
+    if single_pass:
+        # Only a schema-invalid answer (None) falls back to the three-call path.
+        try:
+            extracted = extract_single_pass(text)
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            print("❌ Single-pass extraction failed:", e)
+            mark_error(pdf_id, "extraction failed")
+            return None
+        if extracted is not None:
+            emit_progress(pdf_id, STAGE_GRADE_MATCHED, grade_id=extracted[1], grade=extracted[0])
+    if extracted is None:
+        extracted = extract_multi_pass(pdf_id, text)
+    if extracted is None:
+        mark_error(pdf_id, "extraction failed")
+        return None
+    material_name, grade_id, chem_data, mech_data, raw = extracted
+    emit_progress(pdf_id, STAGE_EXTRACTED, chemical=len(chem_data), mechanical=len(mech_data))
+
+    diameter = find_product_diameter(text)
+    if diameter is not None:
+        print(f"📏 Product diameter: {diameter} mm")
+
+    chem_results, chem_ok = compare_chemical_properties(chem_data, grade_id)
+    mech_results, mech_ok = compare_mechanical_properties(mech_data, grade_id, diameter)
     all_ok = chem_ok and mech_ok
+
+    # Values, results, raw answers and status in one transaction; later norm edits re-check
+    # the stored values without another LLM call (see results_store.py).
+    with db_cursor(commit=True) as cursor:
+        save_extraction(cursor, pdf_id, grade_id, chem_data, mech_data, diameter)
+        save_results(cursor, {pdf_id: (chem_results, mech_results, all_ok)}, {pdf_id: raw})
+    emit_progress(pdf_id, STAGE_COMPARED, status="passed" if all_ok else "failed")
+
     return chem_results, mech_results, all_ok
 
 # === CLI ===
 if __name__ == "__main__":
-    test_pdf_id = 24
-    result = extract_and_compare(test_pdf_id)
-
-    if result is None:
-        print("❌ Extraction and comparison failed.")
-    else:
-        chem_df, mech_df, all_passed = result
-        print("\n🔬 Chemical Comparison:\n", chem_df)
-        print("\n🛠 Mechanical Comparison:\n", mech_df)
-        print("\n✅ Overall Result:", "PASS" if all_passed else "FAIL")
+    import argparse
+
+    cli = argparse.ArgumentParser(description="Validate parsed certificates one by one (see bulk_validate.py for backlogs)")
+    cli.add_argument("ids", nargs="+", type=int, help="parsed_pdfs ids")
+    args = cli.parse_args()
+
+    for pdf_id in args.ids:
+        print(f"\n📄 Certificate {pdf_id}")
+        result = extract_and_compare(pdf_id)
+
+        if result is None:
+            print("❌ Extraction and comparison failed.")
+        else:
+            chem_df, mech_df, all_passed = result
+            print("\n🔬 Chemical Comparison:\n", chem_df)
+            print("\n🛠 Mechanical Comparison:\n", mech_df)
+            print("\n✅ Overall Result:", "PASS" if all_passed else "FAIL")
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { Spinner, Table, Button } from "react-bootstrap";
 import { useNavigate } from "react-router-dom";
 import { Eye } from "lucide-react";
@@ -10,14 +10,29 @@ const ValidatedSuppliers = () => {
     const [loading, setLoading] = useState(true);
     const [search, setSearch] = useState("");
     const [statusFilter, setStatusFilter] = useState("all");
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [stages, setStages] = useState({});
+    const pagesLoaded = useRef(1);
+    const refetchTimer = useRef(null);
+    const resultsRef = useRef([]);
     const navigate = useNavigate();
 
+    const buildUrl = (cursor) => {
+        const params = new URLSearchParams();
+        if (statusFilter !== "all") params.set("status", statusFilter);
+        if (cursor) params.set("cursor", cursor);
+        return `http://localhost:5000/validations?${params.toString()}`;
+    };
+
     const fetchResults = async () => {
         try {
-            const res = await fetch("http://localhost:5000/validations");
+            const res = await fetch(buildUrl(null));
             if (!res.ok) throw new Error("Failed to fetch");
             const data = await res.json();
-            setResults(data);
+            setResults(data.items);
+            setNextCursor(data.next_cursor);
+            pagesLoaded.current = 1;
         } catch (error) {
             console.warn("Fetch error:", error);
         } finally {
@@ -25,11 +40,70 @@ const ValidatedSuppliers = () => {
         }
     };
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const res = await fetch(buildUrl(nextCursor));
+            if (!res.ok) throw new Error("Failed to fetch");
+            const data = await res.json();
+            setResults((prev) => [...prev, ...data.items]);
+            setNextCursor(data.next_cursor);
+            pagesLoaded.current += 1;
+        } catch (error) {
+            console.warn("Fetch error:", error);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
         fetchResults();
-        const interval = setInterval(fetchResults, 10000);
-        return () => clearInterval(interval);
-    }, []);
+
+        if (!window.EventSource) {
+            // No server-sent events: fall back to polling the first page.
+            const interval = setInterval(() => {
+                if (pagesLoaded.current === 1) fetchResults();
+            }, 10000);
+            return () => clearInterval(interval);
+        }
+
+        // Stage transitions are pushed by the server; rows are updated in place and the
+        // list is only re-fetched when a certificate appears that is not shown yet.
+        const source = new EventSource(
+            "http://localhost:5000/validations/stream"
+        );
+        source.addEventListener("progress", (e) => {
+            const event = JSON.parse(e.data);
+            setStages((prev) => ({ ...prev, [event.pdf_id]: event.stage }));
+
+            const known = resultsRef.current.some(
+                (item) => item.certificate_id === event.pdf_id
+            );
+            setResults((prev) =>
+                prev.map((item) => {
+                    if (item.certificate_id !== event.pdf_id) return item;
+                    if (event.stage === "compared")
+                        return { ...item, status: event.status };
+                    if (event.stage === "error")
+                        return { ...item, status: "error" };
+                    return { ...item, status: "pending" };
+                })
+            );
+            if (!known && pagesLoaded.current === 1) {
+                clearTimeout(refetchTimer.current);
+                refetchTimer.current = setTimeout(fetchResults, 1000);
+            }
+        });
+        return () => {
+            source.close();
+            clearTimeout(refetchTimer.current);
+        };
+    }, [statusFilter]);
+
+    useEffect(() => {
+        resultsRef.current = results;
+    }, [results]);
 
     const formatDate = (dateStr) => {
         try {
@@ -40,13 +114,24 @@ const ValidatedSuppliers = () => {
         }
     };
 
-    const renderStatusBadge = (status) => {
+    const stageLabels = {
+        queued: "queued",
+        parsed: "parsed",
+        grade_matched: "grade matched",
+        extracted: "extracted",
+    };
+
+    const renderStatusBadge = (status, stage) => {
         return (
             <span className={`status-pill ${status.toLowerCase()}`}>
                 {status === "passed"
                     ? "Compliant"
                     : status === "failed"
                     ? "Not Compliant"
+                    : status === "error"
+                    ? "Error"
+                    : stageLabels[stage]
+                    ? `Validating (${stageLabels[stage]})`
                     : "Validating"}
             </span>
         );
@@ -57,6 +142,7 @@ const ValidatedSuppliers = () => {
         { value: "passed", label: "Compliant" },
         { value: "failed", label: "Not Compliant" },
         { value: "pending", label: "Validating" },
+        { value: "error", label: "Error" },
     ];
 
     const filteredResults = results.filter((item) => {
@@ -66,10 +152,7 @@ const ValidatedSuppliers = () => {
                 .includes(search.toLowerCase()) ||
             item.category_name?.toLowerCase().includes(search.toLowerCase());
 
-        const matchStatus =
-            statusFilter === "all" || item.status === statusFilter;
-
-        return matchSearch && matchStatus;
+        return matchSearch;
     });
 
     return (
@@ -135,7 +218,10 @@ const ValidatedSuppliers = () => {
                                         <td>{item.certificate_name || "-"}</td>
                                         <td>{item.category_name}</td>
                                         <td>
-                                            {renderStatusBadge(item.status)}
+                                            {renderStatusBadge(
+                                                item.status,
+                                                stages[item.certificate_id]
+                                            )}
                                         </td>
                                         <td>{formatDate(item.date)}</td>
                                         <td>
@@ -176,6 +262,19 @@ const ValidatedSuppliers = () => {
                             )}
                         </tbody>
                     </Table>
+
+                    {nextCursor && (
+                        <div className="text-center">
+                            <Button
+                                variant="outline-dark"
+                                className="rounded-0"
+                                onClick={loadMore}
+                                disabled={loadingMore}
+                            >
+                                {loadingMore ? "Loading..." : "Load more"}
+                            </Button>
+                        </div>
+                    )}
                 </>
             )}
         </div>